@@ -0,0 +1,229 @@
+"""
+Agregações pré-calculadas do dashboard
+Cubo (local_categoria, carac_ph, período) com contagens, somas e somas de quadrados das medidas,
+em três granularidades (dia, semana e mês), construído uma vez por carga de dados, atualizado
+com os deltas da sincronização e consultado a cada rerun no lugar das linhas
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from database import alteracoes_desde, consultar_resumo
+from graficos import FAIXAS_TURBIDEZ
+from instrumentacao import cronometrado
+
+MEDIDAS = ['ph', 'temp_agua_c', 'temp_ar_c', 'umidade_ar_perc', 'turbidez_ntu']
+CHAVES_CUBO = ['local_categoria', 'carac_ph', 'periodo']
+
+# Granularidade -> frequência do pandas (semanas de segunda a domingo). Da mais grossa para a mais fina
+GRANULARIDADES = {'mes': 'M', 'semana': 'W-SUN', 'dia': 'D'}
+
+_cubo_lock = threading.Lock()
+_cubo = {
+    'versao': None,
+    'cubo': None,
+    'atualizacoes': 0,  # vezes em que o cubo foi atualizado por delta em vez de reconstruído
+}
+
+
+def _agregar_dias(df, sinal=1):
+    """
+    Agrega linhas por (local_categoria, carac_ph, dia).
+
+    Para cada medida guarda n_<medida> (valores não nulos), soma_<medida> e
+    soma2_<medida> (soma dos quadrados); a coluna n conta as coletas do grupo.
+    Com sinal=-1 as contribuições saem negativas (linhas a descontar do cubo).
+    """
+    dados = {
+        'local_categoria': df['local_categoria'],
+        'carac_ph': df['carac_ph'],
+        'periodo': df['data_hora'].dt.floor('D'),
+        'n': np.full(len(df), sinal, dtype=np.int64),
+    }
+    for medida in MEDIDAS:
+        valores = df[medida].to_numpy(dtype=np.float64, na_value=np.nan)
+        validos = ~np.isnan(valores)
+        valores = np.where(validos, valores, 0.0)
+        dados[f'n_{medida}'] = sinal * validos.astype(np.int64)
+        dados[f'soma_{medida}'] = sinal * valores
+        dados[f'soma2_{medida}'] = sinal * valores * valores
+
+    return _somar(pd.DataFrame(dados, index=df.index))
+
+
+def _somar(tabela):
+    """Soma as linhas de mesma chave, descarta grupos zerados e ordena pelo período"""
+    somado = (
+        tabela.groupby(CHAVES_CUBO, observed=True, dropna=False, sort=False)
+        .sum()
+        .reset_index()
+    )
+    return somado[somado['n'] != 0].sort_values('periodo', kind='stable', ignore_index=True)
+
+
+def _acumular(diario, granularidade):
+    """Rollup do cubo diário para a granularidade pedida (período = início da semana/mês)"""
+    if granularidade == 'dia':
+        return diario
+    acumulado = diario.copy()
+    acumulado['periodo'] = acumulado['periodo'].dt.to_period(GRANULARIDADES[granularidade]).dt.start_time
+    return _somar(acumulado)
+
+
+def construir_cubo(df):
+    """Cubo em todas as granularidades: {'dia': tabela, 'semana': tabela, 'mes': tabela}"""
+    diario = _agregar_dias(df)
+    return {granularidade: _acumular(diario, granularidade) for granularidade in GRANULARIDADES}
+
+
+def atualizar_cubo(cubo, novos, descartados):
+    """Cubo com as linhas novas somadas e as descartadas descontadas, em todas as granularidades"""
+    partes = [_agregar_dias(novos)] if not novos.empty else []
+    if descartados is not None and not descartados.empty:
+        partes.append(_agregar_dias(descartados, sinal=-1))
+    if not partes:
+        return cubo
+    delta = pd.concat(partes, ignore_index=True)
+    return {
+        granularidade: _somar(pd.concat([tabela, _acumular(delta, granularidade)], ignore_index=True))
+        for granularidade, tabela in cubo.items()
+    }
+
+
+@cronometrado('cubo.obter')
+def obter_cubo(df, versao):
+    """
+    Cubo do frame `df`, da versão `versao`. Quando a versão avança, aplica só os deltas até
+    ela (database.alteracoes_desde); sem eles, reconstrói a partir do frame.
+    """
+    with _cubo_lock:
+        if _cubo['versao'] == versao and _cubo['cubo'] is not None:
+            return _cubo['cubo']
+        # Frame anterior ao cubo guardado (rerun que leu os dados antes de uma sincronização):
+        # responde com um cubo só dele, sem voltar a versão guardada
+        antigo = _cubo['cubo'] is not None and versao < _cubo['versao']
+        if not antigo:
+            alteracoes = alteracoes_desde(_cubo['versao'], versao) if _cubo['cubo'] is not None else None
+            if alteracoes is None:
+                _cubo['cubo'] = construir_cubo(df)
+            else:
+                for novos, descartados in alteracoes:
+                    _cubo['cubo'] = atualizar_cubo(_cubo['cubo'], novos, descartados)
+                _cubo['atualizacoes'] += 1
+            _cubo['versao'] = versao
+            return _cubo['cubo']
+    return construir_cubo(df)
+
+
+def decompor_periodo(data_inicio, data_fim):
+    """
+    Cobre os dias de data_inicio a data_fim (inclusive) com o menor número de períodos:
+    meses inteiros no meio, semanas inteiras nas sobras e dias avulsos nas pontas.
+    Retorna [(granularidade, início, fim exclusivo), ...].
+    """
+    inicio = pd.Timestamp(data_inicio).normalize()
+    fim = pd.Timestamp(data_fim).normalize() + pd.Timedelta(days=1)
+    return _cobrir(inicio, fim, list(GRANULARIDADES)) if inicio < fim else []
+
+
+def _cobrir(inicio, fim, granularidades):
+    granularidade = granularidades[0]
+    if granularidade == 'dia':
+        return [('dia', inicio, fim)]
+
+    # Primeiro início de período >= inicio e último início de período <= fim
+    freq = GRANULARIDADES[granularidade]
+    primeiro = inicio.to_period(freq).start_time
+    if primeiro < inicio:
+        primeiro = (inicio.to_period(freq) + 1).start_time
+    ultimo = fim.to_period(freq).start_time
+    if primeiro >= ultimo:
+        return _cobrir(inicio, fim, granularidades[1:])
+
+    trechos = [(granularidade, primeiro, ultimo)]
+    if inicio < primeiro:
+        trechos = _cobrir(inicio, primeiro, granularidades[1:]) + trechos
+    if ultimo < fim:
+        trechos += _cobrir(ultimo, fim, granularidades[1:])
+    return trechos
+
+
+def _contagem(tabela, coluna):
+    return (
+        tabela.groupby(coluna, observed=True)['n'].sum()
+        .loc[lambda s: s > 0]
+        .sort_values(ascending=False, kind='stable')
+    )
+
+
+@cronometrado('cubo.consulta')
+def consultar_cubo(cubo, local_selecionado, ph_selecionado, data_inicio, data_fim, cat_ph=None, cat_local=None):
+    """
+    Resumo (total, médias e contagens por pH e por local) das coletas que passam nos
+    filtros da sidebar e nas seleções de categoria da pizza (cat_ph) e da barra (cat_local).
+
+    O período é respondido pela combinação de meses, semanas e dias que o cobre exatamente;
+    cada trecho é uma fatia contígua (busca binária) da tabela ordenada por período.
+    """
+    partes = []
+    for granularidade, inicio, fim in decompor_periodo(data_inicio, data_fim):
+        tabela = cubo[granularidade]
+        periodos = tabela['periodo'].to_numpy()
+        a, b = np.searchsorted(periodos, [inicio.to_datetime64(), fim.to_datetime64()])
+        partes.append(tabela.iloc[a:b])
+    selecao = pd.concat(partes, ignore_index=True) if partes else cubo['dia'].iloc[0:0]
+
+    mascara = np.ones(len(selecao), dtype=bool)
+    if local_selecionado != 'Todos':
+        mascara &= (selecao['local_categoria'] == local_selecionado).to_numpy()
+    if 'Todas' not in ph_selecionado:
+        mascara &= selecao['carac_ph'].isin(ph_selecionado).to_numpy()
+    if cat_ph is not None:
+        mascara &= (selecao['carac_ph'] == cat_ph).to_numpy()
+    if cat_local is not None:
+        mascara &= (selecao['local_categoria'] == cat_local).to_numpy()
+
+    selecao = selecao[mascara]
+    somas = selecao.drop(columns=CHAVES_CUBO).sum()
+    return {
+        'total': int(somas['n']),
+        'medias': {
+            medida: somas[f'soma_{medida}'] / somas[f'n_{medida}'] if somas[f'n_{medida}'] else np.nan
+            for medida in MEDIDAS
+        },
+        'contagem_ph': _contagem(selecao, 'carac_ph'),
+        'contagem_local': _contagem(selecao, 'local_categoria'),
+        'linhas_agregadas': len(selecao),
+    }
+
+
+@cronometrado('resumo.banco')
+def consultar_banco(local_selecionado, ph_selecionado, data_inicio, data_fim, cat_ph=None, cat_local=None):
+    """
+    O mesmo resumo de consultar_cubo, calculado no banco (database.consultar_resumo) com os
+    filtros da sidebar somados às seleções de categoria da pizza e da barra
+    """
+    local = None if local_selecionado == 'Todos' else local_selecionado
+    ph = None if 'Todas' in ph_selecionado else list(ph_selecionado)
+    if cat_ph is not None:
+        ph = [cat_ph] if ph is None or cat_ph in ph else []
+    if cat_local is not None:
+        if local not in (None, cat_local):
+            ph = []  # local da barra diferente do local da sidebar: nenhuma coleta passa
+        local = cat_local
+
+    resumo = consultar_resumo(data_inicio, data_fim, local_categoria=local, carac_ph=ph, nbins=FAIXAS_TURBIDEZ)
+    resumo['linhas_agregadas'] = 0  # nenhuma linha agregada no processo
+    return resumo
+
+
+def resumo_linhas(df):
+    """O mesmo resumo de consultar_cubo, calculado direto sobre linhas já filtradas"""
+    return {
+        'total': len(df),
+        'medias': {medida: df[medida].mean() for medida in MEDIDAS},
+        'contagem_ph': df['carac_ph'].value_counts().loc[lambda s: s > 0],
+        'contagem_local': df['local_categoria'].value_counts().loc[lambda s: s > 0],
+        'linhas_agregadas': len(df),
+    }
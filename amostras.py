@@ -0,0 +1,152 @@
+"""
+Índice das amostras para a página de detalhes
+Localiza uma coleta pelo coleta_id, navega entre vizinhas do mesmo local e monta as opções
+do seletor (rótulos e busca) sem varrer o frame a cada rerun
+"""
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Todas as categorias de database.extrair_local_categoria, na ordem de navegação
+ORDEM_LOCAIS = ['Prédio 1', 'Prédio 2', 'Anexo I', 'Anexo II', 'Anexo III', 'Anexo IV', 'Outros']
+TAMANHO_PAGINA = 50
+_MAX_BUSCAS_GUARDADAS = 32
+
+_indice_lock = threading.Lock()
+_indice = {
+    'versao': None,
+    'frame': None,  # weakref do frame indexado: as posições só valem para ele
+    'indice': None,
+}
+
+
+class IndiceAmostras:
+    """
+    coleta_id -> posição da linha no frame (tabela hash) e a ordem de navegação
+    da página: por local (ORDEM_LOCAIS) e, dentro do local, por coleta_id.
+    """
+
+    def __init__(self, df):
+        ids = df['coleta_id'].to_numpy()
+        self._posicao = pd.Index(ids)
+
+        locais = pd.Categorical(df['local_categoria'], categories=ORDEM_LOCAIS, ordered=True)
+        # Ordem de navegação: linhas ordenadas por (local, coleta_id); locais fora da lista ficam por último
+        codigos = np.where(locais.codes < 0, len(ORDEM_LOCAIS), locais.codes)
+        self.ordem = np.lexsort((ids, codigos))
+        self._rank = np.empty(len(ids), dtype=np.int64)
+        self._rank[self.ordem] = np.arange(len(ids))
+
+        # Faixa [inicio, fim) de cada local dentro da ordem
+        codigos_ordenados = codigos[self.ordem]
+        limites = np.searchsorted(codigos_ordenados, np.arange(len(ORDEM_LOCAIS) + 2))
+        self._inicio_local = limites[:-1]
+        self._fim_local = limites[1:]
+        self._codigos = codigos
+
+        # Rótulos do seletor, na ordem de navegação, montados de uma vez com operações vetorizadas
+        ordenado = df.iloc[self.ordem]
+        self.rotulos = (
+            "#" + pd.Series(ids[self.ordem]).astype(str).str.zfill(2)
+            + " | " + ordenado['data_hora'].dt.strftime('%d/%m/%Y %H:%M').reset_index(drop=True)
+            + " | " + ordenado['descricao_local'].astype(str).str[:40].reset_index(drop=True)
+        ).to_numpy(dtype=object)
+        # Texto de busca: rótulo + categoria do local, em minúsculas
+        self._texto_busca = (
+            pd.Series(self.rotulos) + " | " + ordenado['local_categoria'].astype(str).reset_index(drop=True)
+        ).str.lower()
+        self._buscas = {}
+        self._buscas_lock = threading.Lock()
+
+    def linha(self, coleta_id):
+        """Posição (iloc) da coleta no frame, ou None se ela não existir"""
+        try:
+            posicao = self._posicao.get_loc(coleta_id)
+        except KeyError:
+            return None
+        # Com ids repetidos get_loc devolve fatia ou máscara: fica a primeira linha
+        if isinstance(posicao, slice):
+            return posicao.start
+        if isinstance(posicao, np.ndarray):
+            return int(posicao.argmax())
+        return int(posicao)
+
+    def rotulo(self, coleta_id):
+        linha = self.linha(coleta_id)
+        return self.rotulos[self._rank[linha]] if linha is not None else str(coleta_id)
+
+    def buscar(self, texto="", local=None):
+        """
+        Posições (na ordem de navegação) das coletas cujo id, data ou local contêm `texto`,
+        opcionalmente só do `local` informado. As últimas buscas ficam guardadas.
+        """
+        chave = (texto.strip().lower(), local)
+        with self._buscas_lock:
+            if chave in self._buscas:
+                return self._buscas[chave]
+
+        if local in ORDEM_LOCAIS:
+            codigo = ORDEM_LOCAIS.index(local)
+            posicoes = np.arange(self._inicio_local[codigo], self._fim_local[codigo])
+        else:
+            posicoes = np.arange(len(self.ordem))
+        if chave[0]:
+            posicoes = posicoes[self._texto_busca.iloc[posicoes].str.contains(chave[0], regex=False).to_numpy()]
+
+        with self._buscas_lock:
+            if len(self._buscas) >= _MAX_BUSCAS_GUARDADAS:
+                self._buscas.pop(next(iter(self._buscas)))
+            self._buscas[chave] = posicoes
+        return posicoes
+
+    def pagina(self, posicoes, numero, tamanho=TAMANHO_PAGINA):
+        """coleta_ids da página `numero` (1-based) de um resultado de buscar()"""
+        inicio = (numero - 1) * tamanho
+        return [int(i) for i in self._posicao[self.ordem[posicoes[inicio:inicio + tamanho]]]]
+
+    def local_de(self, coleta_id):
+        linha = self.linha(coleta_id)
+        codigo = self._codigos[linha]
+        return ORDEM_LOCAIS[codigo] if codigo < len(ORDEM_LOCAIS) else None
+
+    def posicao_no_local(self, coleta_id):
+        """(posição 0-based da coleta dentro do seu local, total de coletas do local)"""
+        linha = self.linha(coleta_id)
+        if linha is None:
+            return None
+        codigo = self._codigos[linha]
+        return int(self._rank[linha] - self._inicio_local[codigo]), int(self._fim_local[codigo] - self._inicio_local[codigo])
+
+    def posicao_na_ordem(self, coleta_id):
+        """Posição 0-based da coleta na ordem de navegação de todas as coletas (filtro "Todos")"""
+        linha = self.linha(coleta_id)
+        return int(self._rank[linha]) if linha is not None else None
+
+    def vizinha(self, coleta_id, passo):
+        """coleta_id da coleta `passo` posições adiante (ou atrás) no mesmo local, ou None"""
+        linha = self.linha(coleta_id)
+        if linha is None:
+            return None
+        codigo = self._codigos[linha]
+        rank = self._rank[linha] + passo
+        if not self._inicio_local[codigo] <= rank < self._fim_local[codigo]:
+            return None
+        return int(self._posicao[self.ordem[rank]])
+
+
+def obter_indice(df, versao):
+    """
+    Índice do frame atual; só é reconstruído quando a versão dos dados muda ou quando o
+    frame recebido não é o que foi indexado. As posições do índice só valem para esse
+    frame (um delta põe as linhas novas na frente e desloca todas as outras), então uma
+    versão trocada nunca devolve a linha de outra coleta.
+    """
+    with _indice_lock:
+        frame = _indice['frame']() if _indice['frame'] is not None else None
+        if _indice['versao'] != versao or frame is not df or _indice['indice'] is None:
+            _indice['indice'] = IndiceAmostras(df)
+            _indice['versao'] = versao
+            _indice['frame'] = weakref.ref(df)
+        return _indice['indice']
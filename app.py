@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 # Certifique-se de que database.py está no mesmo diretório
-from database import get_all_data, extrair_local_categoria, converter_url_drive
+from database import RESUMO_NO_BANCO, carregar_dados, estatisticas_cache, estatisticas_pool
+from filtros import filtrar
+from agregacoes import obter_cubo, consultar_banco, consultar_cubo, resumo_linhas
+from mapa import obter_indice
+from graficos import (
+    figura_em_cache, figura_pizza, figura_barra, figura_dispersao, figura_mapa, figura_histograma, figura_boxplot,
+    estatisticas_figuras
+)
+from instrumentacao import INSTRUMENTACAO_CONFIG, anotar, finalizar_rerun, iniciar_rerun, medir, painel_debug, registrar
 
 # ==================== CONFIGURAÇÃO DA PÁGINA ====================
 st.set_page_config(
@@ -13,6 +19,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Tempos de cada etapa deste rerun (painel de desempenho e log em JSON)
+rerun = iniciar_rerun('dashboard')
+
 # ==================== CSS CUSTOMIZADO ====================
 st.markdown("""
     <style>
@@ -69,31 +78,35 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# ==================== CARREGAMENTO DOS DADOS ====================
-@st.cache_data(ttl=300)
-def load_data():
-    """Carrega e processa os dados do banco"""
-    df = get_all_data()
-    if not df.empty:
-        # Garante que colunas existam para evitar erros
-        if 'descricao_local' in df.columns:
-            df['local_categoria'] = df['descricao_local'].apply(extrair_local_categoria)
-        if 'url_foto' in df.columns:
-            df['url_foto_view'] = df['url_foto'].apply(converter_url_drive)
-    return df
-
 # ==================== CABEÇALHO ====================
 st.title("💧 Dashboard de Monitoramento da Qualidade da Água")
 
 # ==================== CARREGAMENTO E VALIDAÇÃO ====================
 try:
     with st.spinner("Carregando dados do banco..."):
-        df = load_data()
+        # Frame compartilhado com a página de detalhes: uma linha por coleta, já com local_categoria.
+        # Numa recarga completa a barra acompanha a leitura em lotes
+        barra = st.empty()
+        def mostrar_progresso(lidas, total):
+            barra.progress(min(lidas / total, 1.0), text=f"Carregando coletas: {lidas} de {total}")
+        with medir('dashboard.carregar_dados'):
+            # Frame e versão lidos juntos: todos os caches deste rerun usam a versão do frame
+            df, versao = carregar_dados(progresso=mostrar_progresso)
+        barra.empty()
     
     if df.empty:
         st.error("⚠️ Nenhum dado encontrado no banco de dados!")
         st.stop()
     
+    # Dados servidos do snapshot local: banco fora do ar ou atualização ainda em andamento
+    situacao = estatisticas_cache()
+    salvo_em = situacao['snapshot_salvo_em']
+    desde = f" de {salvo_em:%d/%m/%Y %H:%M}" if salvo_em is not None else ""
+    if situacao['erro']:
+        st.warning(f"⚠️ Banco de dados indisponível: exibindo os últimos dados salvos{desde}.")
+    elif situacao['origem'] == 'snapshot':
+        st.caption(f"Exibindo dados salvos{desde}; atualizando com o banco em segundo plano.")
+    
 except Exception as e:
     st.error(f"❌ Erro ao conectar ao banco de dados: {e}")
     st.info("💡 Verifique suas credenciais no arquivo `config.py`")
@@ -124,78 +137,22 @@ with col2:
 
 st.sidebar.markdown("---")
 st.sidebar.info("💡 **Interatividade:** Clique em qualquer gráfico para filtrar todo o dashboard.")
+mostrar_desempenho = INSTRUMENTACAO_CONFIG.get('painel', True) and st.sidebar.checkbox(
+    "🛠️ Painel de desempenho", key="painel_desempenho"
+)
 
 # ==================== LÓGICA DE FILTRAGEM (SIDEBAR + GRÁFICOS) ====================
 
-# 1. Aplica filtros da Sidebar primeiro (Base)
-df_base = df.copy()
-
-if local_selecionado != 'Todos':
-    df_base = df_base[df_base['local_categoria'] == local_selecionado]
-
-if 'Todas' not in ph_selecionado:
-    df_base = df_base[df_base['carac_ph'].isin(ph_selecionado)]
-
-df_base = df_base[
-    (df_base['data_hora'].dt.date >= data_inicio) &
-    (df_base['data_hora'].dt.date <= data_fim)
-]
+# Coletas ordenadas na grade do mapa: reconstruídas só quando os dados mudam
+indice_mapa = obter_indice(df, versao)
 
-# 2. Prepara dados auxiliares para mapear cliques em gráficos agregados
-# Precisamos saber a ordem das categorias ANTES de filtrar, para saber que o clique no índice 0 é "Ácido", por exemplo.
-ph_counts_base = df_base['carac_ph'].value_counts()
-local_counts_base = df_base['local_categoria'].value_counts().reset_index()
-local_counts_base.columns = ['Local', 'Quantidade']
+resultado_filtro = filtrar(df, local_selecionado, ph_selecionado, data_inicio, data_fim, st.session_state, indice_mapa)
+filtros_ativos = resultado_filtro.filtros_ativos
 
-# 3. Aplica filtros interativos (Cross-filtering)
-df_filtrado = df_base.copy()
-filtros_ativos = []
-
-# --- Filtro vindo do Gráfico de Pizza (pH) ---
-sel_pizza = st.session_state.get("pizza", {}).get("selection", {})
-if sel_pizza and sel_pizza.get("point_indices"):
-    idx = sel_pizza["point_indices"][0]
-    # Mapeia índice do clique -> Categoria usando os dados base
-    if idx < len(ph_counts_base):
-        cat_ph = ph_counts_base.index[idx]
-        df_filtrado = df_filtrado[df_filtrado['carac_ph'] == cat_ph]
-        filtros_ativos.append(f"pH: {cat_ph}")
-
-# --- Filtro vindo do Gráfico de Barras (Local) ---
-sel_barra = st.session_state.get("barra", {}).get("selection", {})
-if sel_barra and sel_barra.get("point_indices"):
-    idx = sel_barra["point_indices"][0]
-    if idx < len(local_counts_base):
-        cat_local = local_counts_base.iloc[idx]['Local']
-        df_filtrado = df_filtrado[df_filtrado['local_categoria'] == cat_local]
-        filtros_ativos.append(f"Local: {cat_local}")
-
-# --- Filtro vindo da Dispersão (Pontos específicos) ---
-# Nota: Como dispersão mostra linhas individuais, filtramos pelos índices se houver seleção
-sel_disp = st.session_state.get("dispersao", {}).get("selection", {})
-if sel_disp and sel_disp.get("point_indices"):
-    # Cuidado: Indices do gráfico são relativos ao dataframe exibido. 
-    # Em arquiteturas complexas isso requer ID único. 
-    # Aqui, assumiremos refino do df_filtrado se a origem for a mesma.
-    indices = sel_disp["point_indices"]
-    if indices and len(indices) < len(df_filtrado): # Só filtra se for um subconjunto
-         df_filtrado = df_filtrado.iloc[indices]
-         filtros_ativos.append("Seleção na Dispersão")
-
-# --- Filtro vindo do Mapa ---
-sel_mapa = st.session_state.get("mapa", {}).get("selection", {})
-if sel_mapa and sel_mapa.get("point_indices"):
-    # O mapa agrupa dados, então o clique retorna o grupo.
-    # Recalculamos o agrupamento do mapa para entender o clique
-    mapa_data_base = df_filtrado.groupby(['latitude', 'longitude', 'descricao_local', 'local_categoria']).size().reset_index(name='quantidade')
-    indices = sel_mapa["point_indices"]
-    if indices:
-        # Pega as coordenadas dos pontos clicados no mapa
-        locais_selecionados = mapa_data_base.iloc[indices][['latitude', 'longitude']]
-        # Filtra o DF principal batendo latitude e longitude
-        # (Inner join simplificado)
-        df_filtrado = df_filtrado.merge(locais_selecionados, on=['latitude', 'longitude'])
-        filtros_ativos.append("Seleção no Mapa")
+# Única cópia de linhas do rerun: só as que passaram em todos os filtros
+df_filtrado = resultado_filtro.linhas(df)
+for etapa, segundos in resultado_filtro.tempos.items():
+    registrar(f"filtros.{etapa}", segundos)
 
 
 # Feedback visual
@@ -207,156 +164,130 @@ st.markdown("## Visão Geral")
 
 col1, col2, col3, col4, col5 = st.columns(5)
 
-# Métricas usam df_filtrado para refletir a seleção
+# Métricas refletem a seleção. Sem seleção de linhas (dispersão/mapa), saem do banco
+# (com DB_CONFIG['resumo_no_banco']) ou do cubo agregado por (local, pH, dia)
+resumo = None
+if resultado_filtro.selecao_linhas:
+    resumo = resumo_linhas(df_filtrado)
+elif RESUMO_NO_BANCO:
+    try:
+        resumo = consultar_banco(
+            local_selecionado, ph_selecionado, data_inicio, data_fim,
+            cat_ph=resultado_filtro.cat_ph, cat_local=resultado_filtro.cat_local
+        )
+    except Exception:
+        pass  # banco indisponível: o cubo responde a partir dos dados em memória
+if resumo is None:
+    # O cubo é reconstruído só quando os dados mudam
+    resumo = consultar_cubo(
+        obter_cubo(df, versao), local_selecionado, ph_selecionado, data_inicio, data_fim,
+        cat_ph=resultado_filtro.cat_ph, cat_local=resultado_filtro.cat_local
+    )
+
+anotar(
+    linhas=len(df), linhas_filtradas=len(df_filtrado), linhas_agregadas=resumo['linhas_agregadas'],
+    memoria_df_bytes=estatisticas_cache()['memoria_bytes'], filtros_ativos=filtros_ativos
+)
+
 with col1:
-    st.metric("🧪 Total", len(df_filtrado))
+    st.metric("🧪 Total", resumo['total'])
 
 with col2:
-    ph_medio = df_filtrado['ph'].mean()
+    ph_medio = resumo['medias']['ph']
     val = f"{ph_medio:.2f}" if not pd.isna(ph_medio) else "-"
     st.metric("pH Médio", val)
 
 with col3:
-    temp_agua_media = df_filtrado['temp_agua_c'].mean()
+    temp_agua_media = resumo['medias']['temp_agua_c']
     val = f"{temp_agua_media:.1f}°C" if not pd.isna(temp_agua_media) else "-"
     st.metric("Temp. Água", val)
 
 with col4:
-    temp_ar_media = df_filtrado['temp_ar_c'].mean()
+    temp_ar_media = resumo['medias']['temp_ar_c']
     val = f"{temp_ar_media:.1f}°C" if not pd.isna(temp_ar_media) else "-"
     st.metric("Temp. Ar", val)
 
 with col5:
-    umidade_media = df_filtrado['umidade_ar_perc'].mean()
+    umidade_media = resumo['medias']['umidade_ar_perc']
     val = f"{umidade_media:.1f}%" if not pd.isna(umidade_media) else "-"
     st.metric("Umidade", val)
 
 # ==================== GRÁFICOS ====================
+def exibir_grafico(fig, chave):
+    """Envia a figura ao navegador (serialização incluída no tempo medido)"""
+    with medir(f"grafico.{chave}.envio"):
+        # ADICIONADO: on_select="rerun"
+        st.plotly_chart(fig, use_container_width=True, key=chave, on_select="rerun")
+
 if df_filtrado.empty:
     st.warning("⚠️ Nenhuma amostra encontrada com os filtros selecionados.")
 else:
+    # As figuras dependem só dos dados e das linhas filtradas: com a mesma versão e a mesma
+    # seleção de linhas elas saem prontas do cache (de qualquer sessão)
+    chave_figuras = (versao, resultado_filtro.assinatura())
+
     # ========== LINHA 1: 3 GRÁFICOS ==========
     col1, col2, col3 = st.columns(3)
     
     with col1:
         st.markdown("### pH")
-        # Recalcula contagem baseado no df_filtrado
-        ph_counts = df_filtrado['carac_ph'].value_counts()
-        if not ph_counts.empty:
-            fig_pizza = px.pie(
-                values=ph_counts.values,
-                names=ph_counts.index,
-                color_discrete_sequence=px.colors.sequential.RdBu,
-                hole=0.4
-            )
-            fig_pizza.update_traces(textposition='inside', textinfo='percent+label', textfont_size=9)
-            fig_pizza.update_layout(
-                showlegend=True, height=220, margin=dict(t=5, b=5, l=5, r=5),
-                legend=dict(font=dict(size=8))
-            )
-            # ADICIONADO: on_select="rerun"
-            st.plotly_chart(fig_pizza, use_container_width=True, key="pizza", on_select="rerun")
+        fig_pizza = figura_em_cache('pizza', chave_figuras, lambda: figura_pizza(resumo['contagem_ph']))
+        if fig_pizza is not None:
+            exibir_grafico(fig_pizza, "pizza")
         else:
             st.info("Sem dados")
     
     with col2:
         st.markdown("### Locais")
-        local_counts = df_filtrado['local_categoria'].value_counts().reset_index()
-        local_counts.columns = ['Local', 'Quantidade']
-        
-        if not local_counts.empty:
-            fig_barra = px.bar(
-                local_counts,
-                x='Local', y='Quantidade',
-                color='Quantidade', color_continuous_scale='Blues',
-                text='Quantidade'
-            )
-            fig_barra.update_traces(textposition='outside', textfont_size=9)
-            fig_barra.update_layout(
-                height=220, showlegend=False, xaxis_title="", yaxis_title="Qtd",
-                margin=dict(t=5, b=5, l=5, r=5), font=dict(size=9), xaxis=dict(tickangle=-45)
-            )
-            # ADICIONADO: on_select="rerun"
-            st.plotly_chart(fig_barra, use_container_width=True, key="barra", on_select="rerun")
+        fig_barra = figura_em_cache('barra', chave_figuras, lambda: figura_barra(resumo['contagem_local']))
+        if fig_barra is not None:
+            exibir_grafico(fig_barra, "barra")
         else:
             st.info("Sem dados")
     
     with col3:
         st.markdown("### Temp x Umidade")
-        fig_dispersao = px.scatter(
-            df_filtrado,
-            x='temp_ar_c', y='umidade_ar_perc',
-            color='carac_ph', size='ph',
-            hover_data=['descricao_local'],
-            color_discrete_sequence=px.colors.qualitative.Set2,
-            labels={'temp_ar_c': 'Temp (°C)', 'umidade_ar_perc': 'Umidade (%)', 'carac_ph': 'pH'}
-        )
-        fig_dispersao.update_layout(
-            height=220, margin=dict(t=5, b=5, l=5, r=5),
-            legend=dict(orientation="h", yanchor="bottom", y=-0.6, font=dict(size=8)),
-            font=dict(size=9)
-        )
-        # ADICIONADO: on_select="rerun"
-        st.plotly_chart(fig_dispersao, use_container_width=True, key="dispersao", on_select="rerun")
+        # Acima do limite vai uma amostra estratificada por pH; a seleção volta às coletas reais
+        fig_dispersao, pontos_exibidos = figura_em_cache('dispersao', chave_figuras, lambda: figura_dispersao(df_filtrado))
+        exibir_grafico(fig_dispersao, "dispersao")
+        if pontos_exibidos < len(df_filtrado):
+            st.caption(f"Exibindo {pontos_exibidos} de {len(df_filtrado)} pontos")
     
     # ========== LINHA 2: 3 GRÁFICOS ==========
     col1, col2, col3 = st.columns(3)
     
     with col1:
         st.markdown("### Mapa")
-        # Agrupa dados para o mapa
-        mapa_data = df_filtrado.groupby(['latitude', 'longitude', 'descricao_local', 'local_categoria']).size().reset_index(name='quantidade')
-        
-        if not mapa_data.empty:
-            fig_mapa = px.scatter_mapbox(
-                mapa_data,
-                lat='latitude', lon='longitude', size='quantidade',
-                color='local_categoria', hover_name='descricao_local',
-                hover_data={'quantidade': True, 'latitude': ':.5f', 'longitude': ':.5f'},
-                color_discrete_sequence=px.colors.qualitative.Set3,
-                size_max=25, zoom=15, height=220
-            )
-            fig_mapa.update_layout(
-                mapbox_style="open-street-map",
-                margin=dict(t=0, b=0, l=0, r=0),
-                legend=dict(font=dict(size=7))
-            )
-            # ADICIONADO: on_select="rerun"
-            st.plotly_chart(fig_mapa, use_container_width=True, key="mapa", on_select="rerun")
+        # Um marcador por célula da grade (no máximo LIMITE_MARCADORES); o clique volta às coletas da célula
+        fig_mapa = figura_em_cache(
+            'mapa', chave_figuras, lambda: figura_mapa(*indice_mapa.agregar(resultado_filtro.mascara))
+        )
+        if fig_mapa is not None:
+            exibir_grafico(fig_mapa, "mapa")
         else:
             st.info("Sem dados geográficos")
-    
+
     with col2:
         st.markdown("### Turbidez")
-        fig_histograma = px.histogram(
-            df_filtrado,
-            x='turbidez_ntu', nbins=15,
-            color_discrete_sequence=['#636EFA'],
-            labels={'turbidez_ntu': 'Turbidez (NTU)', 'count': 'Freq'}
+        # Só as faixas já contadas vão para o navegador, não os valores de cada coleta.
+        # No modo servidor elas vêm contadas do banco junto com as métricas
+        faixas_turbidez = resumo.get('histograma_turbidez')
+        fig_histograma = figura_em_cache(
+            'histograma', chave_figuras, lambda: figura_histograma(df_filtrado, faixas_turbidez)
         )
-        fig_histograma.update_layout(
-            height=220, showlegend=False, xaxis_title="Turbidez (NTU)", yaxis_title="Freq",
-            margin=dict(t=5, b=5, l=5, r=5), font=dict(size=9)
-        )
-        # ADICIONADO: on_select="rerun"
-        st.plotly_chart(fig_histograma, use_container_width=True, key="histograma", on_select="rerun")
+        exibir_grafico(fig_histograma, "histograma")
     
     with col3:
         st.markdown("### Temperaturas")
-        temp_data = pd.DataFrame({
-            'Temperatura': list(df_filtrado['temp_agua_c']) + list(df_filtrado['temp_ar_c']),
-            'Tipo': ['Água'] * len(df_filtrado) + ['Ar'] * len(df_filtrado)
-        })
-        
-        fig_boxplot = px.box(
-            temp_data,
-            x='Tipo', y='Temperatura', color='Tipo',
-            color_discrete_map={'Água': '#3498db', 'Ar': '#e74c3c'},
-            labels={'Temperatura': 'Temp (°C)'}
-        )
-        fig_boxplot.update_layout(
-            height=220, showlegend=False, xaxis_title="", yaxis_title="Temp (°C)",
-            margin=dict(t=5, b=5, l=5, r=5), font=dict(size=9)
-        )
-        # ADICIONADO: on_select="rerun"
-        st.plotly_chart(fig_boxplot, use_container_width=True, key="boxplot", on_select="rerun")
\ No newline at end of file
+        # Quartis, bigodes e outliers calculados aqui; o plotly só desenha as caixas
+        fig_boxplot = figura_em_cache('boxplot', chave_figuras, lambda: figura_boxplot(df_filtrado))
+        exibir_grafico(fig_boxplot, "boxplot")
+
+# ==================== DESEMPENHO ====================
+if mostrar_desempenho:
+    painel_debug(rerun, {
+        'cache_dados': estatisticas_cache(),
+        'cache_figuras': estatisticas_figuras(),
+        'pool_conexoes': estatisticas_pool(),
+    })
+finalizar_rerun()
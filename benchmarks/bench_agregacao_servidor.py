@@ -0,0 +1,74 @@
+"""
+Benchmark: métricas da sidebar calculadas em pandas (carga completa) x no banco (consultar_resumo)
+
+Uso: python benchmarks/bench_agregacao_servidor.py [n_linhas ...]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import sqlite_local
+
+TAMANHOS = [10_000, 100_000, 1_000_000]
+INDICES_SQL = os.path.join(sqlite_local.RAIZ, 'sql', 'indices.sql')
+
+
+def resumo_pandas(df, data_inicio, data_fim, local_categoria, carac_ph):
+    """O mesmo resumo, calculado como o app.py faz: filtrando o frame completo em memória"""
+    mascara = (
+        (df['data_hora'] >= pd.Timestamp(data_inicio))
+        & (df['data_hora'] < pd.Timestamp(data_fim) + pd.Timedelta(days=1))
+        & (df['local_categoria'] == local_categoria)
+        & df['carac_ph'].isin(carac_ph)
+    )
+    filtrado = df[mascara]
+    return {
+        'total': len(filtrado),
+        'medias': {col: filtrado[col].mean() for col in ['ph', 'temp_agua_c', 'temp_ar_c', 'umidade_ar_perc']},
+        # Colunas categóricas: value_counts também lista as categorias sem ocorrência
+        'contagem_ph': filtrado['carac_ph'].value_counts().loc[lambda s: s > 0],
+        'contagem_local': filtrado['local_categoria'].value_counts().loc[lambda s: s > 0],
+    }
+
+
+def medir(func):
+    inicio = time.perf_counter()
+    resultado = func()
+    return time.perf_counter() - inicio, resultado
+
+
+def main(tamanhos):
+    print(f"{'linhas':>10} | {'carga+pandas (s)':>16} | {'só pandas (s)':>13} | {'servidor (s)':>12}")
+    for n in tamanhos:
+        caminho = os.path.join(tempfile.gettempdir(), f"bench_servidor_{n}.sqlite")
+        sqlite_local.criar_banco(caminho, n)
+        with sqlite3.connect(caminho) as conn, open(INDICES_SQL) as f:
+            conn.executescript(f.read())
+        database = sqlite_local.instalar(caminho)
+        
+        filtros = dict(data_inicio='2020-03-01', data_fim='2020-12-31', local_categoria='Anexo III', carac_ph=['Ácido', 'Neutro'])
+        
+        def carga_e_pandas():
+            df = database.sincronizar_dados(forcar_completa=True)
+            return resumo_pandas(df, **filtros)
+        
+        t_completo, esperado = medir(carga_e_pandas)
+        df = database.sincronizar_dados()
+        t_pandas, _ = medir(lambda: resumo_pandas(df, **filtros))
+        t_servidor, obtido = medir(lambda: database.consultar_resumo(**filtros))
+        
+        assert obtido['total'] == esperado['total']
+        assert np.allclose(list(obtido['medias'].values()), list(esperado['medias'].values()))
+        assert obtido['contagem_ph'].sort_index().tolist() == esperado['contagem_ph'].sort_index().tolist()
+        
+        print(f"{n:>10} | {t_completo:>16.3f} | {t_pandas:>13.3f} | {t_servidor:>12.3f}")
+        os.remove(caminho)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or TAMANHOS)
@@ -0,0 +1,51 @@
+"""
+Benchmark: carga completa com read_sql (get_all_data) x carga em lotes (carregar_em_lotes)
+
+Mede tempo e pico de memória alocada (tracemalloc) das duas cargas, incluindo a
+preparação do frame (local_categoria e dtypes compactos), e confere que os frames são iguais.
+
+Uso: python benchmarks/bench_carga_lotes.py [n_linhas]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import sqlite_local
+
+N_LINHAS = 200_000
+
+
+def medir(funcao):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcao()
+    tempo = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, tempo, pico
+
+
+def main(n):
+    caminho = os.path.join(tempfile.gettempdir(), f"bench_carga_lotes_{n}.sqlite")
+    if not os.path.exists(caminho):
+        sqlite_local.criar_banco(caminho, n)
+    database = sqlite_local.instalar(caminho)
+    
+    def read_sql():
+        return database._preparar(database.get_all_data())
+    
+    esperado, t_read_sql, pico_read_sql = medir(read_sql)
+    obtido, t_lotes, pico_lotes = medir(database.carregar_em_lotes)
+    
+    assert obtido.equals(esperado), "carregar_em_lotes divergiu de get_all_data"
+    final = esperado.memory_usage(deep=True).sum()
+    mb = 1024 * 1024
+    print(f"{n} linhas, frame final {final / mb:.1f} MB")
+    print(f"read_sql: {t_read_sql:.2f} s, pico {pico_read_sql / mb:.1f} MB ({pico_read_sql / final:.1f}x o frame)")
+    print(f"em lotes: {t_lotes:.2f} s, pico {pico_lotes / mb:.1f} MB ({pico_lotes / final:.1f}x o frame)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else N_LINHAS)
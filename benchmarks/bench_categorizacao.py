@@ -0,0 +1,47 @@
+"""
+Micro-benchmark: apply(extrair_local_categoria) x categorizar_locais
+
+Uso: python benchmarks/bench_categorizacao.py [n_linhas]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import sqlite_local
+
+N_LINHAS = 1_000_000
+
+# Variações de escrita encontradas nas descrições, incluindo os casos de precedência
+# (Anexo III antes de Anexo I, Anexo IV antes de Anexo I)
+BASES = sqlite_local.DESCRICOES_LOCAIS + [
+    'anexo 3 - bebedouro', 'ANEXO 1 sala 12', 'Anexo IIII?', 'Anexo II - copa',
+    'prédio 2 térreo', 'PREDIO 1', 'Torre 2', 'torre 1', 'Ginásio',
+]
+
+
+def main(n):
+    rng = np.random.default_rng(0)
+    # Descrições com sufixos numéricos para ter algumas centenas de valores distintos, mais nulos
+    distintos = [f"{base} #{i}" for base in BASES for i in range(20)] + [None]
+    serie = pd.Series(np.array(distintos, dtype=object)[rng.integers(0, len(distintos), n)])
+    
+    database = sqlite_local.instalar(':memory:')
+    
+    inicio = time.perf_counter()
+    esperado = serie.apply(database.extrair_local_categoria)
+    t_apply = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    obtido = database.categorizar_locais(serie)
+    t_vetorizado = time.perf_counter() - inicio
+    
+    assert obtido.equals(esperado), "categorizar_locais divergiu de extrair_local_categoria"
+    print(f"{n} linhas, {serie.nunique(dropna=False)} descrições distintas")
+    print(f"apply:        {t_apply:.3f} s")
+    print(f"vetorizado:   {t_vetorizado:.3f} s  ({t_apply / t_vetorizado:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else N_LINHAS)
@@ -0,0 +1,190 @@
+"""
+Benchmark por etapas: carga, enriquecimento, filtragem, agregação, construção das figuras e as
+duas páginas de ponta a ponta (streamlit AppTest), sobre o banco SQLite sintético.
+
+Cada execução é acrescentada a benchmarks/resultados/bench_etapas.jsonl e comparada com a
+anterior de mesmo tamanho; etapas mais lentas que LIMITE_REGRESSAO x a anterior são marcadas.
+
+Uso: python benchmarks/bench_etapas.py [n_linhas ...] [--sem-app]
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import sqlite_local
+
+TAMANHOS = [10_000, 100_000, 1_000_000]
+REPETICOES = 5
+ARQUIVO_RESULTADOS = os.path.join(sqlite_local.RAIZ, 'benchmarks', 'resultados', 'bench_etapas.jsonl')
+# Etapa marcada como regressão quando fica mais lenta que isso x a execução anterior
+# (e ao menos PISO_REGRESSAO_S mais lenta, para ruído em etapas de microssegundos não contar)
+LIMITE_REGRESSAO = 1.25
+PISO_REGRESSAO_S = 0.005
+
+
+def mediana(func, repeticoes=REPETICOES):
+    """Mediana do tempo de `repeticoes` chamadas e o resultado da última"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos.append(time.perf_counter() - inicio)
+    return float(np.median(tempos)), resultado
+
+
+def medir_etapas(database, repeticoes):
+    import agregacoes
+    import filtros
+    import graficos
+    import mapa
+
+    etapas = {}
+    # Leitura sem as conversões e as conversões isoladas (cópia do frame fora da medição)
+    etapas['carga.read_sql'], bruto = mediana(database.get_all_data, repeticoes)
+    etapas['carga.em_lotes'], df = mediana(database.carregar_em_lotes, repeticoes)
+    copias = iter([bruto.copy() for _ in range(3 * repeticoes)])
+    etapas['enriquecimento.categorizacao'], _ = mediana(lambda: database._enriquecer(next(copias)), repeticoes)
+    etapas['enriquecimento.esquema'], _ = mediana(lambda: database._aplicar_esquema(database._enriquecer(next(copias))), repeticoes)
+    etapas['enriquecimento.esquema'] -= etapas['enriquecimento.categorizacao']
+    etapas['enriquecimento.derivadas'], _ = mediana(lambda: database.derivar_colunas(df.copy(deep=False)), repeticoes)
+
+    # Filtros: sem filtro, filtros da sidebar e seleção no mapa
+    inicio, fim = df['data_hora'].min().date(), df['data_hora'].max().date()
+    recente = (df['data_hora'].max() - np.timedelta64(90, 'D')).date()
+    etapas['filtros.sem_filtro'], _ = mediana(lambda: filtros.filtrar(df, 'Todos', ['Todas'], inicio, fim, {}), repeticoes)
+    etapas['filtros.sidebar'], resultado = mediana(
+        lambda: filtros.filtrar(df, 'Anexo III', ['Ácido', 'Neutro'], recente, fim, {}), repeticoes
+    )
+
+    # Agregações: cubo e índice do mapa (uma vez por versão dos dados) e consultas (a cada rerun)
+    etapas['agregacao.cubo_construcao'], cubo = mediana(lambda: agregacoes.construir_cubo(df), repeticoes)
+    etapas['agregacao.cubo_consulta'], resumo = mediana(
+        lambda: agregacoes.consultar_cubo(cubo, 'Todos', ['Todas'], inicio, fim), repeticoes
+    )
+    etapas['agregacao.mapa_indice'], indice = mediana(lambda: mapa.IndiceEspacial(df), repeticoes)
+    todas = np.ones(len(df), dtype=bool)
+    etapas['agregacao.mapa_celulas'], (celulas, zoom) = mediana(lambda: indice.agregar(todas), repeticoes)
+    celula = {'mapa': {'selection': {'points': [{'customdata': [int(celulas['nivel'][0]), int(celulas['celula'][0])]}]}}}
+    etapas['filtros.mapa'], _ = mediana(
+        lambda: filtros.filtrar(df, 'Todos', ['Todas'], inicio, fim, celula, indice), repeticoes
+    )
+    etapas['filtros.materializacao'], linhas = mediana(lambda: resultado.linhas(df), repeticoes)
+
+    # Figuras, sem o cache (sobre todas as linhas: o pior caso)
+    figuras = {
+        'pizza': lambda: graficos.figura_pizza(resumo['contagem_ph']),
+        'barra': lambda: graficos.figura_barra(resumo['contagem_local']),
+        'dispersao': lambda: graficos.figura_dispersao(df),
+        'mapa': lambda: graficos.figura_mapa(celulas, zoom),
+        'histograma': lambda: graficos.figura_histograma(df),
+        'boxplot': lambda: graficos.figura_boxplot(df),
+    }
+    for nome, construir in figuras.items():
+        etapas[f'grafico.{nome}'], _ = mediana(construir, repeticoes)
+    return etapas
+
+
+def medir_paginas(database, repeticoes):
+    """Primeiro rerun (carga a frio) e reruns seguintes de cada página, pelo AppTest"""
+    from streamlit.testing.v1 import AppTest
+
+    etapas = {}
+    for nome, arquivo in [('dashboard', 'app.py'), ('detalhes', os.path.join('pages', 'Detalhes_das_Amostras.py'))]:
+        database.reiniciar()
+        database.SNAPSHOT_CAMINHO = None
+        pagina = AppTest.from_file(os.path.join(sqlite_local.RAIZ, arquivo), default_timeout=600)
+        inicio = time.perf_counter()
+        pagina.run()
+        etapas[f'pagina.{nome}.primeiro_rerun'] = time.perf_counter() - inicio
+        if pagina.exception:
+            raise RuntimeError(f"{arquivo}: {pagina.exception[0].value}")
+        etapas[f'pagina.{nome}.rerun'], _ = mediana(pagina.run, repeticoes)
+    return etapas
+
+
+def versao_codigo():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=sqlite_local.RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def anterior(n, caminho=ARQUIVO_RESULTADOS):
+    """Última execução registrada com n linhas, ou None"""
+    if not os.path.exists(caminho):
+        return None
+    ultima = None
+    with open(caminho, encoding='utf-8') as f:
+        for linha in f:
+            registro = json.loads(linha)
+            if registro['linhas'] == n:
+                ultima = registro
+    return ultima
+
+
+def registrar(registro, caminho=ARQUIVO_RESULTADOS):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+
+def comparar(etapas, registro_anterior):
+    """Tabela das etapas com a variação em relação à execução anterior; retorna as regressões"""
+    antes = registro_anterior['etapas_s'] if registro_anterior else {}
+    regressoes = []
+    print(f"{'etapa':<36} | {'ms':>10} | {'anterior':>10} | {'variação':>9}")
+    for etapa, segundos in etapas.items():
+        linha = f"{etapa:<36} | {segundos * 1000:>10.1f} | "
+        if etapa in antes and antes[etapa] > 0:
+            razao = segundos / antes[etapa]
+            linha += f"{antes[etapa] * 1000:>10.1f} | {100 * (razao - 1):>+8.0f}%"
+            if razao > LIMITE_REGRESSAO and segundos - antes[etapa] > PISO_REGRESSAO_S:
+                linha += "  ⚠️ regressão"
+                regressoes.append(etapa)
+        else:
+            linha += f"{'-':>10} | {'-':>9}"
+        print(linha)
+    return regressoes
+
+
+def main(tamanhos, com_app=True):
+    regressoes = []
+    for n in tamanhos:
+        caminho = os.path.join(tempfile.gettempdir(), f"bench_etapas_{n}.sqlite")
+        if not os.path.exists(caminho):
+            sqlite_local.criar_banco(caminho, n)
+        database = sqlite_local.instalar(caminho)
+        repeticoes = REPETICOES if n < 1_000_000 else 3
+
+        etapas = medir_etapas(database, repeticoes)
+        if com_app:
+            etapas.update(medir_paginas(database, repeticoes))
+
+        registro = {
+            'quando': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': versao_codigo(),
+            'python': platform.python_version(),
+            'linhas': n,
+            'repeticoes': repeticoes,
+            'etapas_s': etapas,
+        }
+        print(f"\n{n} linhas (commit {registro['commit']})")
+        regressoes += [f"{n}: {etapa}" for etapa in comparar(etapas, anterior(n))]
+        registrar(registro)
+
+    if regressoes:
+        print("\nRegressões:", ", ".join(regressoes))
+    return regressoes
+
+
+if __name__ == '__main__':
+    argumentos = sys.argv[1:]
+    main([int(arg) for arg in argumentos if not arg.startswith('--')] or TAMANHOS, '--sem-app' not in argumentos)
@@ -0,0 +1,299 @@
+"""
+Teste de carga: N sessões simultâneas (streamlit AppTest, sem navegador) sobre o banco SQLite sintético
+
+Cada sessão é uma thread que abre o dashboard ou a página de detalhes e repete ações de um
+usuário (trocar filtros da sidebar, clicar na pizza, na barra e no mapa, navegar entre amostras);
+cada ação é um rerun completo do script, como no servidor. Mede a latência dos reruns
+(p50/p95/p99), a vazão do processo e a memória residente.
+
+Uso: python benchmarks/bench_sessoes.py [n_sessoes ...] [--linhas=N] [--acoes=N] [--pausa=S]
+"""
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+
+import sqlite_local
+from bench_etapas import registrar, versao_codigo
+
+SESSOES = [1, 4, 16]
+N_LINHAS = 100_000
+ACOES_POR_SESSAO = 20
+# Uma em cada SESSOES_POR_DETALHES sessões fica na página de detalhes; as demais, no dashboard
+SESSOES_POR_DETALHES = 3
+ARQUIVO_RESULTADOS = os.path.join(sqlite_local.RAIZ, 'benchmarks', 'resultados', 'bench_sessoes.jsonl')
+
+PAGINAS = {
+    'dashboard': 'app.py',
+    'detalhes': os.path.join('pages', 'Detalhes_das_Amostras.py'),
+}
+
+
+def memoria_residente():
+    """Memória residente do processo em bytes (Linux: /proc; nos demais, o pico do getrusage)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == 'darwin' else pico * 1024
+
+
+class MonitorMemoria:
+    """Amostra a memória residente numa thread enquanto o teste roda"""
+
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+        self.pico = self.inicial = memoria_residente()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, name='monitor-memoria', daemon=True)
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, memoria_residente())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self.final = memoria_residente()
+        self.pico = max(self.pico, self.final)
+
+
+@contextmanager
+def runtime_compartilhado():
+    """
+    O AppTest instala um Runtime falso no início de cada run e o remove no fim, e compila o
+    script de novo a cada run; com sessões em paralelo, o fim de um run derrubaria o runtime
+    dos outros (e o ast.parse do Python 3.11 não é seguro entre threads). Enquanto o teste dura,
+    quem pede o runtime fora de um run recebe um reserva e todos os runs usam um único cache de
+    bytecode, como no servidor, onde os dois são únicos.
+    """
+    from unittest.mock import MagicMock, patch
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.util import patch_config_options
+
+    reserva = MagicMock(spec=Runtime)
+    reserva.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    reserva.cache_storage_manager = MemoryCacheStorageManager()
+    cache_scripts = ScriptCache()
+    with patch.object(Runtime, 'instance', classmethod(lambda cls: cls._instance or reserva)), \
+            patch('streamlit.testing.v1.app_test.ScriptCache', lambda: cache_scripts), \
+            patch('streamlit.testing.v1.local_script_runner.ScriptCache', lambda: cache_scripts), \
+            patch.object(Runtime, 'exists', classmethod(lambda cls: True)), \
+            patch_config_options({"global.appTest": True}):
+        yield
+
+
+def _clique(*chaves):
+    """Estado de seleção de um st.plotly_chart com os pontos de customdata `chaves`"""
+    return {'selection': {
+        'points': [{'customdata': list(chave)} for chave in chaves],
+        'point_indices': list(range(len(chaves))), 'box': [], 'lasso': [],
+    }}
+
+
+SEM_SELECAO = _clique()
+
+
+class Sessao:
+    """Uma sessão simulada: a página aberta e o roteiro de ações sorteado com a semente dela"""
+
+    def __init__(self, numero, pagina, alvos, acoes, pausa, semente=0):
+        from streamlit.testing.v1 import AppTest
+
+        self.numero = numero
+        self.pagina = pagina
+        self.alvos = alvos
+        self.acoes = acoes
+        self.pausa = pausa
+        self.rng = random.Random(semente + numero)
+        self.app = AppTest.from_file(os.path.join(sqlite_local.RAIZ, PAGINAS[pagina]), default_timeout=600)
+        self.latencias = []  # (ação, segundos)
+        self.erros = []
+
+    def _rerun(self, acao):
+        inicio = time.perf_counter()
+        self.app.run()
+        self.latencias.append((acao, time.perf_counter() - inicio))
+        self.erros += [f"{self.pagina}/{acao}: {e.value}" for e in self.app.exception]
+
+    # ---------- dashboard ----------
+    def _acao_dashboard(self):
+        app, alvos, rng = self.app, self.alvos, self.rng
+        acao = rng.choice(['local', 'ph', 'periodo', 'pizza', 'barra', 'mapa', 'limpar'])
+        if acao == 'local':
+            app.sidebar.selectbox[0].select(rng.choice(['Todos'] + alvos['locais']))
+        elif acao == 'ph':
+            app.sidebar.multiselect[0].set_value(rng.choice([['Todas'], ['Ácido'], ['Neutro', 'Básico']]))
+        elif acao == 'periodo':
+            dias = (alvos['data_max'] - alvos['data_min']).days
+            app.sidebar.date_input[0].set_value(alvos['data_min'] + timedelta(days=rng.randint(0, dias)))
+        elif acao == 'pizza':
+            app.session_state['pizza'] = _clique([rng.choice(['Ácido', 'Neutro', 'Básico'])])
+        elif acao == 'barra':
+            app.session_state['barra'] = _clique([rng.choice(alvos['locais'])])
+        elif acao == 'mapa':
+            app.session_state['mapa'] = _clique(rng.choice(alvos['celulas']))
+        else:
+            for chave in ['pizza', 'barra', 'mapa']:
+                app.session_state[chave] = SEM_SELECAO
+            app.sidebar.selectbox[0].select('Todos')
+            app.sidebar.multiselect[0].set_value(['Todas'])
+            app.sidebar.date_input[0].set_value(alvos['data_min'])
+        return acao
+
+    # ---------- detalhes ----------
+    def _acao_detalhes(self):
+        app, alvos, rng = self.app, self.alvos, self.rng
+        botoes = [b for b in app.sidebar.button if not b.disabled]
+        acao = rng.choice(['local', 'amostra', 'busca'] + (['navegar'] * 3 if botoes else []))
+        if acao == 'local':
+            app.selectbox(key='local_amostra').select(rng.choice(['Todos'] + alvos['locais']))
+        elif acao == 'amostra':
+            seletor = app.selectbox(key='amostra')
+            if seletor.options:
+                seletor.select_index(rng.randrange(len(seletor.options)))
+        elif acao == 'busca':
+            app.text_input(key='busca_amostra').input(rng.choice(['', '', str(rng.choice(alvos['ids'])), 'anexo']))
+        else:
+            rng.choice(botoes).click()
+        return acao
+
+    def executar(self, inicio=None):
+        if inicio is not None:
+            inicio.wait()
+        acao = 'abrir'
+        try:
+            self._rerun(acao)
+            for _ in range(self.acoes):
+                acao = self._acao_dashboard() if self.pagina == 'dashboard' else self._acao_detalhes()
+                self._rerun(acao)
+                if self.pausa:
+                    time.sleep(self.pausa)
+        except Exception as e:
+            # Falha do roteiro (widget ausente após um rerun com erro, por exemplo): encerra a sessão
+            self.erros.append(f"{self.pagina}/{acao}: {e!r}")
+
+
+def preparar(n_linhas):
+    """Banco sintético, dados já em memória e os alvos dos cliques (locais, células do mapa, ids)"""
+    import mapa
+
+    caminho = os.path.join(tempfile.gettempdir(), f"bench_etapas_{n_linhas}.sqlite")
+    if not os.path.exists(caminho):
+        sqlite_local.criar_banco(caminho, n_linhas)
+    database = sqlite_local.instalar(caminho)
+    df, versao = database.carregar_dados()
+    celulas, _ = mapa.obter_indice(df, versao).agregar(np.ones(len(df), dtype=bool))
+    return database, {
+        'locais': sorted(df['local_categoria'].unique().tolist()),
+        'celulas': list(zip(celulas['nivel'].tolist(), celulas['celula'].tolist())),
+        'ids': df['coleta_id'].sample(200, random_state=0).tolist(),
+        'data_min': df['data_hora'].min().date(),
+        'data_max': df['data_hora'].max().date(),
+    }
+
+
+def rodar(n_sessoes, alvos, acoes, pausa):
+    """Roda n_sessoes sessões ao mesmo tempo e devolve o resumo das latências, vazão e memória"""
+    sessoes = [
+        Sessao(i, 'detalhes' if i % SESSOES_POR_DETALHES == 1 else 'dashboard', alvos, acoes, pausa)
+        for i in range(n_sessoes)
+    ]
+    inicio = threading.Event()
+    threads = [threading.Thread(target=s.executar, args=(inicio,), name=f"sessao-{s.numero}") for s in sessoes]
+    for thread in threads:
+        thread.start()
+
+    with MonitorMemoria() as memoria:
+        t0 = time.perf_counter()
+        inicio.set()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - t0
+
+    resumo = {'sessoes': n_sessoes, 'duracao_s': duracao, 'erros': sum((s.erros for s in sessoes), [])}
+    for pagina in ['todas', *PAGINAS]:
+        latencias = np.array([
+            segundos for s in sessoes if pagina in ('todas', s.pagina) for _, segundos in s.latencias
+        ])
+        if not len(latencias):
+            continue
+        resumo[pagina] = {
+            'reruns': len(latencias),
+            'p50_ms': float(np.percentile(latencias, 50) * 1000),
+            'p95_ms': float(np.percentile(latencias, 95) * 1000),
+            'p99_ms': float(np.percentile(latencias, 99) * 1000),
+            'max_ms': float(latencias.max() * 1000),
+        }
+    # Mediana por ação (gravada no JSON): mostra quais interações pesam mais
+    por_acao = {}
+    for sessao in sessoes:
+        for acao, segundos in sessao.latencias:
+            por_acao.setdefault(f"{sessao.pagina}/{acao}", []).append(segundos)
+    resumo['p50_ms_por_acao'] = {acao: float(np.median(v) * 1000) for acao, v in sorted(por_acao.items())}
+    resumo['reruns_por_s'] = resumo['todas']['reruns'] / duracao
+    resumo['memoria'] = {'inicial_mb': memoria.inicial / 2**20, 'pico_mb': memoria.pico / 2**20, 'final_mb': memoria.final / 2**20}
+    return resumo
+
+
+def main(lista_sessoes, n_linhas=N_LINHAS, acoes=ACOES_POR_SESSAO, pausa=0.0):
+    _, alvos = preparar(n_linhas)
+    # Aquecimento: uma sessão de cada página (caches de cubo, índices e figuras do processo)
+    for pagina in PAGINAS:
+        Sessao(0, pagina, alvos, 3, 0).executar()
+
+    print(f"{n_linhas} linhas, {acoes} ações por sessão, pausa {pausa} s")
+    print(f"{'sessões':>7} | {'reruns/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'max ms':>8} | {'pico MB':>8} | erros")
+    resultados = []
+    for n_sessoes in lista_sessoes:
+        with runtime_compartilhado():
+            resumo = rodar(n_sessoes, alvos, acoes, pausa)
+        todas = resumo['todas']
+        print(
+            f"{n_sessoes:>7} | {resumo['reruns_por_s']:>8.1f} | {todas['p50_ms']:>8.0f} | {todas['p95_ms']:>8.0f} | "
+            f"{todas['p99_ms']:>8.0f} | {todas['max_ms']:>8.0f} | {resumo['memoria']['pico_mb']:>8.0f} | {len(resumo['erros'])}"
+        )
+        for pagina in PAGINAS:
+            if pagina in resumo:
+                estat = resumo[pagina]
+                print(f"{'':>7}   {pagina}: {estat['reruns']} reruns, p50 {estat['p50_ms']:.0f} ms, p95 {estat['p95_ms']:.0f} ms")
+        for erro in resumo['erros'][:5]:
+            print(f"{'':>7}   ⚠️ {erro}")
+        resultados.append(resumo)
+
+    registrar({
+        'quando': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': versao_codigo(),
+        'linhas': n_linhas,
+        'acoes_por_sessao': acoes,
+        'pausa_s': pausa,
+        'resultados': resultados,
+    }, ARQUIVO_RESULTADOS)
+    return resultados
+
+
+if __name__ == '__main__':
+    opcoes = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    main(
+        [int(arg) for arg in sys.argv[1:] if not arg.startswith('--')] or SESSOES,
+        n_linhas=int(opcoes.get('linhas', N_LINHAS)),
+        acoes=int(opcoes.get('acoes', ACOES_POR_SESSAO)),
+        pausa=float(opcoes.get('pausa', 0.0)),
+    )
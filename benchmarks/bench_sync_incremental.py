@@ -0,0 +1,43 @@
+"""
+Benchmark: recarga completa x sincronização incremental (database.sincronizar_dados)
+
+Uso: python benchmarks/bench_sync_incremental.py [n_linhas ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import sqlite_local
+
+TAMANHOS = [10_000, 100_000, 1_000_000]
+NOVAS_COLETAS = 100
+
+
+def medir(func):
+    inicio = time.perf_counter()
+    resultado = func()
+    return time.perf_counter() - inicio, resultado
+
+
+def main(tamanhos):
+    print(f"{'linhas':>10} | {'completa (s)':>12} | {'delta (s)':>10} | {'ganho':>7}")
+    for n in tamanhos:
+        caminho = os.path.join(tempfile.gettempdir(), f"bench_sync_{n}.sqlite")
+        sqlite_local.criar_banco(caminho, n)
+        database = sqlite_local.instalar(caminho)
+        
+        t_completa, _ = medir(lambda: database.sincronizar_dados(forcar_completa=True))
+        sqlite_local.inserir_coletas(caminho, n + 1, NOVAS_COLETAS)
+        t_delta, df_delta = medir(database.sincronizar_dados)
+        
+        # O resultado incremental deve ser idêntico ao de uma recarga completa
+        _, df_completo = medir(lambda: database.sincronizar_dados(forcar_completa=True))
+        assert df_delta.equals(df_completo), "delta divergiu da recarga completa"
+        
+        print(f"{n:>10} | {t_completa:>12.3f} | {t_delta:>10.3f} | {t_completa / t_delta:>6.1f}x")
+        os.remove(caminho)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or TAMANHOS)
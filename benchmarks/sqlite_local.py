@@ -0,0 +1,289 @@
+"""
+Banco SQLite local que substitui o MySQL nos benchmarks
+Cria as tabelas LOCAIS, COLETAS e FOTOS com dados sintéticos e redireciona database.get_connection
+
+Uso: python benchmarks/sqlite_local.py caminho.sqlite n_coletas [semente]
+"""
+import os
+import random
+import sqlite3
+import sys
+import types
+import warnings
+import zlib
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+DESCRICOES_LOCAIS = [
+    'Anexo I - Bebedouro térreo',
+    'Anexo III - Laboratório de química',
+    'Anexo IV - Corredor',
+    'Prédio 1 - Cantina',
+    'Predio 2 - Banheiro 2º andar',
+    'Torre 2 - Hall',
+    'Estacionamento',
+]
+PREDIOS_DESCRICOES = ['Anexo I', 'Anexo III', 'Anexo IV', 'Prédio 1', 'Prédio 2', 'Prédio 2', 'Outros']
+
+# Prédios (com as grafias que aparecem nas descrições, como em extrair_local_categoria) e pontos
+# de coleta dentro deles, usados para gerar LOCAIS com muitos pontos
+PREDIOS = {
+    'Anexo I': ['Anexo I', 'Anexo 1', 'ANEXO I'],
+    'Anexo II': ['Anexo II', 'Anexo 2'],
+    'Anexo III': ['Anexo III', 'Anexo 3', 'anexo iii'],
+    'Anexo IV': ['Anexo IV', 'Anexo 4'],
+    'Prédio 1': ['Prédio 1', 'Predio 1', 'PRÉDIO 1'],
+    'Prédio 2': ['Prédio 2', 'Predio 2', 'Torre 2'],
+    'Outros': ['Ginásio', 'Estacionamento', 'Portaria', 'Restaurante universitário'],
+}
+PONTOS = [
+    'Bebedouro térreo', 'Bebedouro 1º andar', 'Bebedouro 2º andar', 'Banheiro térreo',
+    'Banheiro 2º andar', 'Laboratório de química', 'Cantina', 'Corredor', 'Hall', 'Torneira externa',
+]
+# Centro do campus (Itabira/MG) e raio aproximado dos prédios em graus
+CAMPUS = (-19.6565, -43.2070)
+
+SCHEMA = """
+CREATE TABLE LOCAIS (
+    local_id INTEGER PRIMARY KEY,
+    latitude REAL,
+    longitude REAL,
+    descricao_local TEXT
+);
+CREATE TABLE COLETAS (
+    coleta_id INTEGER PRIMARY KEY,
+    local_id INTEGER,
+    data_hora TEXT,
+    descricao_amostra TEXT,
+    ph REAL,
+    carac_ph TEXT,
+    turbidez_ntu INTEGER,
+    temp_agua_c REAL,
+    temp_ar_c REAL,
+    umidade_ar_perc REAL,
+    h_ion_conc REAL,
+    oh_ion_conc REAL,
+    ponto_orvalho_c REAL
+);
+CREATE TABLE FOTOS (
+    foto_id INTEGER PRIMARY KEY,
+    coleta_id INTEGER,
+    url_foto TEXT
+);
+"""
+
+
+class _Cursor:
+    """Cursor que aceita o paramstyle do pymysql (%s)"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=None):
+        return self._cursor.execute(query.replace('%s', '?'), tuple(params or ()))
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _concat_ws(separador, *valores):
+    return separador.join(str(v) for v in valores if v is not None)
+
+
+def _crc32(texto):
+    return None if texto is None else zlib.crc32(str(texto).encode('utf-8'))
+
+
+class _BitXor:
+    """Agregação BIT_XOR do MySQL"""
+
+    def __init__(self):
+        self.valor = 0
+
+    def step(self, valor):
+        if valor is not None:
+            self.valor ^= int(valor)
+
+    def finalize(self):
+        return self.valor
+
+
+class ConexaoSQLite:
+    """Conexão SQLite com a mesma interface usada de uma conexão pymysql"""
+
+    def __init__(self, caminho):
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        # Funções do MySQL usadas nos checksums da sincronização
+        self._conn.create_function('CONCAT_WS', -1, _concat_ws, deterministic=True)
+        self._conn.create_function('CRC32', 1, _crc32, deterministic=True)
+        self._conn.create_aggregate('BIT_XOR', 1, _BitXor)
+
+    def cursor(self, *args):
+        return _Cursor(self._conn.cursor())
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def gerar_locais(n_locais, semente=0):
+    """
+    `n_locais` linhas de LOCAIS: pontos de coleta espalhados pelos prédios do campus, com as
+    grafias variadas das descrições e coordenadas agrupadas por prédio
+    """
+    rng = random.Random(semente)
+    centros = {
+        predio: (CAMPUS[0] + rng.uniform(-0.004, 0.004), CAMPUS[1] + rng.uniform(-0.004, 0.004))
+        for predio in PREDIOS
+    }
+    # Pontos de um prédio a poucos metros do centro dele
+    def local(descricao, predio):
+        lat, lon = centros[predio]
+        return (len(locais) + 1, lat + rng.gauss(0, 0.0001), lon + rng.gauss(0, 0.0001), descricao)
+    
+    locais = []
+    for descricao, predio in zip(DESCRICOES_LOCAIS, PREDIOS_DESCRICOES):
+        locais.append(local(descricao, predio))
+    while len(locais) < n_locais:
+        predio = rng.choice(list(PREDIOS))
+        grafia = rng.choice(PREDIOS[predio])
+        locais.append(local(f"{grafia} - {rng.choice(PONTOS)}" if predio != 'Outros' else grafia, predio))
+    return locais[:n_locais]
+
+
+def gerar_coletas(inicio_id, quantidade, n_locais, semente=0):
+    """
+    Linhas de COLETAS e FOTOS para os ids inicio_id .. inicio_id + quantidade - 1.
+
+    Uma coleta a cada ~20 minutos a partir de 2020; temperaturas com sazonalidade anual,
+    umidade inversamente ligada à temperatura do ar, pH em torno de 7,1, turbidez com
+    cauda longa, alguns sensores sem leitura e fotos com URLs do Google Drive nos dois
+    formatos (?id= e /file/d/.../view). H+, OH- e ponto de orvalho calculados como no banco.
+    """
+    rng = np.random.default_rng(semente + inicio_id)
+    ids = np.arange(inicio_id, inicio_id + quantidade)
+    data_hora = np.datetime64('2020-01-01T00:00:00') + (ids * 1200 + rng.integers(-600, 600, quantidade)).astype('timedelta64[s]')
+    dia_ano = (data_hora - data_hora.astype('datetime64[Y]')).astype('timedelta64[D]').astype(np.int64)
+    
+    temp_ar = np.round(22 + 5 * np.sin(2 * np.pi * (dia_ano - 15) / 365) + rng.normal(0, 3, quantidade), 1)
+    temp_agua = np.round(0.6 * temp_ar + 8 + rng.normal(0, 1.5, quantidade), 1)
+    umidade = np.round(np.clip(70 - 1.5 * (temp_ar - 22) + rng.normal(0, 10, quantidade), 20, 100), 1)
+    ph = np.round(np.clip(rng.normal(7.1, 0.5, quantidade), 4.5, 9.5), 2)
+    carac_ph = np.where(ph < 6.8, 'Ácido', np.where(ph <= 7.2, 'Neutro', 'Básico'))
+    turbidez = np.minimum(rng.lognormal(3.5, 1.0, quantidade), 1000).astype(np.int64)
+    gama = np.log(umidade / 100) + 17.62 * temp_ar / (243.12 + temp_ar)
+    orvalho = np.round(243.12 * gama / (17.62 - gama), 1)
+    
+    # ~1% das coletas sem leitura de umidade (sem ponto de orvalho)
+    sem_umidade = rng.random(quantidade) < 0.01
+    descricoes = np.array([None, None, None, 'Amostra de rotina', 'Água turva', 'Coleta após manutenção'], dtype=object)
+    
+    coletas = list(zip(
+        ids.tolist(), rng.integers(1, n_locais + 1, quantidade).tolist(),
+        np.datetime_as_string(data_hora).astype(object).tolist(),
+        descricoes[rng.integers(0, len(descricoes), quantidade)].tolist(),
+        ph.tolist(), carac_ph.tolist(), turbidez.tolist(), temp_agua.tolist(), temp_ar.tolist(),
+        np.where(sem_umidade, None, umidade).tolist(),
+        (10.0 ** -ph).tolist(), (10.0 ** -(14 - ph)).tolist(),
+        np.where(sem_umidade, None, orvalho).tolist(),
+    ))
+    # Formato ISO com 'T' do numpy -> formato do MySQL
+    coletas = [(c[0], c[1], c[2].replace('T', ' '), *c[3:]) for c in coletas]
+    
+    # ~80% das coletas têm foto; algumas têm mais de uma
+    n_fotos = rng.choice(4, size=quantidade, p=[0.2, 0.6, 0.15, 0.05])
+    fotos = []
+    for coleta_id, n in zip(ids[n_fotos > 0].tolist(), n_fotos[n_fotos > 0].tolist()):
+        for i in range(n):
+            file_id = f"1{coleta_id:09d}{i}Fx"
+            if (coleta_id + i) % 2:
+                fotos.append((coleta_id, f"https://drive.google.com/open?id={file_id}"))
+            else:
+                fotos.append((coleta_id, f"https://drive.google.com/file/d/{file_id}/view?usp=sharing"))
+    return coletas, fotos
+
+
+def inserir_coletas(caminho, inicio_id, quantidade, semente=0, lote=100_000):
+    """Insere `quantidade` coletas (com fotos) a partir de `inicio_id`"""
+    conn = sqlite3.connect(caminho)
+    n_locais = conn.execute("SELECT COUNT(*) FROM LOCAIS").fetchone()[0]
+    for inicio in range(inicio_id, inicio_id + quantidade, lote):
+        coletas, fotos = gerar_coletas(inicio, min(lote, inicio_id + quantidade - inicio), n_locais, semente)
+        conn.executemany("INSERT INTO COLETAS VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", coletas)
+        conn.executemany("INSERT INTO FOTOS (coleta_id, url_foto) VALUES (?,?)", fotos)
+    conn.commit()
+    conn.close()
+
+
+def criar_banco(caminho, n_coletas, semente=0, n_locais=None):
+    """
+    Cria (sobrescrevendo) um banco SQLite com `n_coletas` coletas sintéticas. Sem `n_locais`,
+    usa ~1 ponto de coleta para cada 500 coletas (entre 7 e 200)
+    """
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    n_locais = n_locais or min(max(n_coletas // 500, len(DESCRICOES_LOCAIS)), 200)
+    conn = sqlite3.connect(caminho)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO LOCAIS VALUES (?,?,?,?)", gerar_locais(n_locais, semente))
+    conn.commit()
+    conn.close()
+    inserir_coletas(caminho, 1, n_coletas, semente)
+
+
+def instalar(caminho):
+    """Faz o módulo database usar o banco SQLite em `caminho`"""
+    if 'config' not in sys.modules:
+        try:
+            import config  # noqa: F401
+        except ImportError:
+            config = types.ModuleType('config')
+            config.DB_CONFIG = {}
+            sys.modules['config'] = config
+    
+    # pandas avisa ao receber uma conexão DBAPI que não seja sqlite3/SQLAlchemy
+    warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
+    
+    import database
+    database.reiniciar()
+    database.SNAPSHOT_CAMINHO = None  # os benchmarks medem o banco, não o snapshot
+    database.get_connection = lambda: ConexaoSQLite(caminho)
+    return database
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    criar_banco(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"{sys.argv[1]}: {int(sys.argv[2])} coletas")
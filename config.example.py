@@ -9,4 +9,30 @@ DB_CONFIG = {
     'password': 'sua_senha_aqui',  # ALTERE: senha do MySQL
     'database': 'monitoramento_agua',
     'charset': 'utf8mb4',
-}
\ No newline at end of file
+    'cache_ttl_s': 60,             # intervalo entre as verificações de mudança no banco (em segundo plano)
+    'recarga_completa_s': 3600,    # intervalo entre recargas completas (entre elas só o delta é buscado)
+    'pool_tamanho': 5,             # máximo de conexões abertas pelo processo
+    'pool_idade_maxima_s': 3600,   # conexões mais velhas que isso são recriadas
+    'pool_timeout_s': 30,          # espera máxima por uma conexão livre
+    'carga_lote_linhas': 5000,     # linhas lidas por vez na carga completa
+    'resumo_no_banco': False,      # True: métricas e contagens calculadas no banco a cada rerun (sem seleção na dispersão/mapa)
+    # Snapshot local dos dados (requer pyarrow): início rápido e dados disponíveis com o banco fora do ar.
+    # Padrão: .cache_dados/coletas.arrow; None desativa
+    # 'snapshot_caminho': '.cache_dados/coletas.arrow',
+}
+
+# Cache local das miniaturas das fotos (opcional; estes são os valores padrão)
+MINIATURAS_CONFIG = {
+    'diretorio': '.cache_miniaturas',  # onde as miniaturas redimensionadas ficam guardadas
+    'limite_mb': 200,                  # tamanho máximo do cache em disco
+    'largura': 500,                    # largura das miniaturas, em pixels
+    'backend': 'drive',                # 'drive' ou 'diretorio' (imagens locais, para uso offline)
+    # 'diretorio_origem': 'fotos/',    # com backend 'diretorio': pasta com arquivos <id_do_drive>.<ext>
+}
+
+# Instrumentação de desempenho (opcional; estes são os valores padrão)
+INSTRUMENTACAO_CONFIG = {
+    'painel': True,                # mostra a opção "Painel de desempenho" na sidebar
+    'arquivo_log': None,           # ex.: 'desempenho.jsonl' grava uma linha JSON por rerun
+    'amostras_por_etapa': 1000,    # medições guardadas por etapa para p50/p95
+}
@@ -1,27 +1,58 @@
 """
 Módulo para gerenciar conexão e consultas ao banco de dados
 """
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
 import pymysql
 import pandas as pd
 from config import DB_CONFIG
+from instrumentacao import cronometrado, medir
 
-def get_connection():
-    """Cria e retorna uma conexão com o banco de dados"""
-    try:
-        connection = pymysql.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database'],
-            charset=DB_CONFIG['charset']
-        )
-        return connection
-    except Exception as e:
-        raise Exception(f"Erro ao conectar ao banco de dados: {e}")
+try:
+    import pyarrow.feather as feather
+except ImportError:  # sem pyarrow não há snapshot local
+    feather = None
 
-def get_all_data():
-    """Busca todos os dados necessários do banco"""
-    query = """
+# Intervalo (s) entre recargas completas; entre elas só o delta é buscado
+RECARGA_COMPLETA_S = DB_CONFIG.get('recarga_completa_s', 3600)
+
+# Intervalo (s) entre as verificações de mudança no banco feitas em segundo plano
+# (o frame em memória é servido direto; só é recarregado quando a assinatura muda)
+CACHE_TTL_S = DB_CONFIG.get('cache_ttl_s', 60)
+
+# Pool de conexões
+POOL_TAMANHO = DB_CONFIG.get('pool_tamanho', 5)
+POOL_IDADE_MAXIMA_S = DB_CONFIG.get('pool_idade_maxima_s', 3600)
+POOL_TIMEOUT_S = DB_CONFIG.get('pool_timeout_s', 30)
+
+# Linhas lidas por vez na carga completa (cursor sem buffer, ver carregar_em_lotes)
+CARGA_LOTE_LINHAS = DB_CONFIG.get('carga_lote_linhas', 5000)
+
+# Métricas e gráficos agregados do dashboard calculados no banco (consultar_resumo) em vez
+# do cubo em memória, quando não há seleção de linhas específicas (dispersão/mapa)
+RESUMO_NO_BANCO = DB_CONFIG.get('resumo_no_banco', False)
+
+# Snapshot local (Arrow IPC) do último frame carregado do banco; None desativa
+SNAPSHOT_CAMINHO = DB_CONFIG.get(
+    'snapshot_caminho',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_dados', 'coletas.arrow')
+)
+
+# Deltas guardados para alteracoes_desde(); quem ficar mais atrás que isso recalcula tudo
+MAX_ALTERACOES = 16
+
+# Sincronização incremental: COLETAS é comparada em blocos de BLOCO_IDS coleta_ids (contagem e
+# checksum de cada bloco) e só os blocos que mudaram são buscados de novo. A assinatura
+# verificada em segundo plano inclui o checksum das últimas JANELA_EDICOES_IDS coletas
+BLOCO_IDS = 1000
+JANELA_EDICOES_IDS = 5000
+
+_QUERY_DADOS = """
     SELECT 
         c.coleta_id,
         c.data_hora,
@@ -37,23 +68,1028 @@ def get_all_data():
         c.ponto_orvalho_c,
         l.latitude,
         l.longitude,
-        l.descricao_local,
-        f.url_foto
+        l.descricao_local
     FROM COLETAS c
     INNER JOIN LOCAIS l ON c.local_id = l.local_id
-    LEFT JOIN FOTOS f ON c.coleta_id = f.coleta_id
+"""
+
+# Checksum de uma linha de COLETAS (qualquer coluna editada muda o valor)
+_CHECKSUM_LINHA = """CRC32(CONCAT_WS('|', c.coleta_id, c.local_id, c.data_hora, c.descricao_amostra,
+    c.ph, c.carac_ph, c.turbidez_ntu, c.temp_agua_c, c.temp_ar_c, c.umidade_ar_perc,
+    c.h_ion_conc, c.oh_ion_conc, c.ponto_orvalho_c))"""
+
+# Assinatura barata do conteúdo do banco: se não mudou, não há o que sincronizar
+_QUERY_ASSINATURA = f"""
+    SELECT
+        (SELECT MAX(coleta_id) FROM COLETAS),
+        (SELECT COUNT(*) FROM COLETAS),
+        (SELECT MAX(data_hora) FROM COLETAS),
+        (SELECT BIT_XOR({_CHECKSUM_LINHA}) FROM COLETAS c
+         WHERE c.coleta_id > (SELECT MAX(coleta_id) FROM COLETAS) - %s),
+        (SELECT COUNT(*) FROM FOTOS),
+        (SELECT MAX(coleta_id) FROM FOTOS)
+"""
+
+# Contagem e checksum por bloco de coleta_ids (ver BLOCO_IDS)
+_QUERY_BLOCOS = f"""
+    SELECT FLOOR(c.coleta_id / %s) AS bloco, COUNT(*) AS linhas, BIT_XOR({_CHECKSUM_LINHA}) AS soma
+    FROM COLETAS c
+    GROUP BY bloco
+"""
+
+_QUERY_CONTAGEM = """
+    SELECT COUNT(*)
+    FROM COLETAS c
+    INNER JOIN LOCAIS l ON c.local_id = l.local_id
+"""
+
+# Estado do carregamento incremental, compartilhado por todas as sessões do processo
+_sync_lock = threading.RLock()
+_sync = {
+    'df': None,
+    'blocos': None,       # _checksums_blocos() do banco correspondente ao frame atual
+    'ultima_recarga_completa': None,  # None: nenhuma recarga completa do banco ainda
+    'versao': 0,
+    # (versão, linhas novas, linhas descartadas) dos últimos deltas, para agregados incrementais
+    'alteracoes': deque(maxlen=MAX_ALTERACOES),
+    'assinatura': None,   # parte de COLETAS da assinatura_dados() vista antes da última sincronização
+}
+
+# Uma sincronização com o banco por vez; quem só lê o frame (carregar_dados) não espera por ela
+_atualizacao_lock = threading.RLock()
+
+# Tabela de fotos, carregada sob demanda (ver carregar_fotos)
+_fotos_lock = threading.Lock()
+_fotos = {
+    'df': None,
+    'carregado_em': None,
+    'assinatura': None,   # parte de FOTOS da assinatura quando a tabela foi carregada
+}
+
+# Cache de dados compartilhado pelas páginas (ver carregar_dados)
+_cache = {
+    'carregado_em': None,
+    'hits': 0,
+    'misses': 0,
+    'memoria_bytes': 0,
+    'memoria_bytes_sem_esquema': 0,
+    'origem': None,       # 'banco' ou 'snapshot'
+    'erro': None,         # última falha ao falar com o banco, enquanto durar
+    'divergencias': None, # ver conferir_derivadas
+}
+
+# Gravação do snapshot em segundo plano
+_snapshot_lock = threading.Lock()
+_snapshot = {
+    'pendente': {},       # caminho -> frame esperando para ser gravado
+    'gravando': False,
+    'salvo_em': None,     # data do snapshot em uso (quando os dados vieram dele)
+}
+
+# Thread que verifica o banco periodicamente e sincroniza quando algo muda (ver _laco_atualizador)
+_atualizador_lock = threading.Lock()
+_atualizador = {
+    'thread': None,
+    'parar': None,        # Event que encerra a thread atual
+    'acordar': threading.Event(),
+    'verificacoes': 0,
+    'sincronizacoes': 0,
+    'ultima_verificacao': None,
+    'ultima_assinatura_fotos': None,
+}
+
+def get_connection():
+    """Cria e retorna uma conexão com o banco de dados"""
+    try:
+        connection = pymysql.connect(
+            host=DB_CONFIG['host'],
+            user=DB_CONFIG['user'],
+            password=DB_CONFIG['password'],
+            database=DB_CONFIG['database'],
+            charset=DB_CONFIG['charset']
+        )
+        return connection
+    except Exception as e:
+        raise Exception(f"Erro ao conectar ao banco de dados: {e}")
+
+class PoolConexoes:
+    """Pool limitado e thread-safe de conexões, testadas com ping e recriadas após `idade_maxima` segundos"""
+    
+    def __init__(self, criar, tamanho=5, idade_maxima=3600, timeout=30):
+        self._criar = criar
+        self._tamanho = tamanho
+        self._idade_maxima = idade_maxima
+        self._timeout = timeout
+        self._livres = []  # (conexão, instante de criação)
+        self._abertas = 0
+        self._fechado = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'hits': 0,          # conexões reaproveitadas
+            'misses': 0,        # conexões novas abertas
+            'recicladas': 0,    # descartadas por idade ou ping com falha
+            'esperas': 0,       # pedidos que encontraram o pool esgotado
+            'tempo_espera_total_s': 0.0,
+            'tempo_espera_max_s': 0.0,
+        }
+    
+    def _reservar(self):
+        """Retira uma conexão livre ou reserva vaga para uma nova (retorna None nesse caso)"""
+        inicio = time.monotonic()
+        with self._cond:
+            esperou = False
+            while not self._livres and self._abertas >= self._tamanho:
+                esperou = True
+                restante = self._timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    raise Exception(f"Erro ao conectar ao banco de dados: nenhuma conexão livre após {self._timeout}s")
+                self._cond.wait(restante)
+            
+            if esperou:
+                espera = time.monotonic() - inicio
+                self._stats['esperas'] += 1
+                self._stats['tempo_espera_total_s'] += espera
+                self._stats['tempo_espera_max_s'] = max(self._stats['tempo_espera_max_s'], espera)
+            
+            if self._livres:
+                return self._livres.pop()
+            self._abertas += 1
+            return None
+    
+    def _valida(self, conexao, criada_em):
+        if time.monotonic() - criada_em >= self._idade_maxima:
+            return False
+        try:
+            conexao.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+    
+    def obter(self):
+        """Retorna (conexão, instante de criação); devolva com devolver()"""
+        reservada = self._reservar()
+        if reservada is not None:
+            conexao, criada_em = reservada
+            if self._valida(conexao, criada_em):
+                with self._cond:
+                    self._stats['hits'] += 1
+                return conexao, criada_em
+            self._fechar(conexao)
+            with self._cond:
+                self._stats['recicladas'] += 1
+        
+        try:
+            conexao = self._criar()
+        except Exception:
+            with self._cond:
+                self._abertas -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['misses'] += 1
+        return conexao, time.monotonic()
+    
+    def devolver(self, conexao, criada_em, descartar=False):
+        """Devolve a conexão ao pool; com `descartar` ela é fechada e a vaga liberada"""
+        if not descartar and self._fechado:
+            descartar = True
+        if not descartar:
+            try:
+                # Encerra a transação para que a próxima consulta enxergue dados novos
+                conexao.rollback()
+            except Exception:
+                descartar = True
+        
+        if descartar:
+            self._fechar(conexao)
+        with self._cond:
+            if descartar:
+                self._abertas -= 1
+            else:
+                self._livres.append((conexao, criada_em))
+            self._cond.notify()
+    
+    @contextmanager
+    def conexao(self):
+        conexao, criada_em = self.obter()
+        try:
+            yield conexao
+        except BaseException:
+            # Inclui as interrupções do Streamlit (RerunException/StopException), que não
+            # derivam de Exception: a consulta pode ter ficado pela metade, então a conexão
+            # é descartada, mas a vaga sempre volta ao pool
+            self.devolver(conexao, criada_em, descartar=True)
+            raise
+        self.devolver(conexao, criada_em)
+    
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['abertas'] = self._abertas
+            stats['livres'] = len(self._livres)
+        stats['tamanho'] = self._tamanho
+        pedidos = stats['hits'] + stats['misses']
+        stats['taxa_hits'] = stats['hits'] / pedidos if pedidos else 0.0
+        stats['tempo_espera_medio_s'] = stats['tempo_espera_total_s'] / stats['esperas'] if stats['esperas'] else 0.0
+        return stats
+    
+    def fechar(self):
+        """Fecha as conexões livres (as emprestadas são fechadas ao serem devolvidas)"""
+        with self._cond:
+            livres, self._livres = self._livres, []
+            self._abertas -= len(livres)
+            self._fechado = True
+        for conexao, _ in livres:
+            self._fechar(conexao)
+    
+    @staticmethod
+    def _fechar(conexao):
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Retorna o pool de conexões do processo, criando-o no primeiro uso"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolConexoes(
+                lambda: get_connection(),
+                tamanho=POOL_TAMANHO,
+                idade_maxima=POOL_IDADE_MAXIMA_S,
+                timeout=POOL_TIMEOUT_S,
+            )
+        return _pool
+
+def reiniciar():
+    """Fecha o pool e descarta os dados em memória (ao trocar de banco, por exemplo)"""
+    global _pool
+    _parar_atualizador()
+    with _pool_lock, _sync_lock:
+        if _pool is not None:
+            _pool.fechar()
+        _pool = None
+        _sync.update(df=None, blocos=None, ultima_recarga_completa=None, assinatura=None)
+        _sync['alteracoes'].clear()
+        _fotos.update(df=None, carregado_em=None, assinatura=None)
+        _cache.update(carregado_em=None, origem=None, erro=None, divergencias=None)
+
+def conexao():
+    """Empresta uma conexão do pool: `with conexao() as connection: ...`"""
+    return get_pool().conexao()
+
+def estatisticas_pool():
+    """Hits, misses e tempos de espera do pool de conexões"""
+    return get_pool().estatisticas()
+
+@cronometrado('banco.get_all_data')
+def get_all_data():
+    """Busca os dados das coletas no banco: uma linha por coleta_id (fotos ficam em get_fotos)"""
+    query = _QUERY_DADOS + "ORDER BY c.data_hora DESC"
+    
+    with conexao() as connection:
+        try:
+            df = pd.read_sql(query, connection)
+            df['data_hora'] = pd.to_datetime(df['data_hora'])
+            return df
+        except Exception as e:
+            raise Exception(f"Erro ao buscar dados: {e}")
+
+@cronometrado('banco.carga_completa')
+def carregar_em_lotes(progresso=None, tamanho_lote=None):
+    """Carga completa em lotes (SSCursor) para buffers por coluna, já enriquecida; chama `progresso(lidas, total)` a cada lote"""
+    tamanho_lote = tamanho_lote or CARGA_LOTE_LINHAS
+    
+    with conexao() as connection:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(_QUERY_CONTAGEM)
+                total = int(cursor.fetchone()[0])
+            
+            buffers = _BuffersColunas(total)
+            cursor = connection.cursor(pymysql.cursors.SSCursor)
+            try:
+                cursor.execute(_QUERY_DADOS + "ORDER BY c.data_hora DESC")
+                buffers.definir_colunas([d[0] for d in cursor.description])
+                while True:
+                    with medir('banco.carga_leitura'):
+                        linhas = cursor.fetchmany(tamanho_lote)
+                    if not linhas:
+                        break
+                    with medir('banco.carga_conversao'):
+                        buffers.adicionar(linhas)
+                    if progresso is not None:
+                        progresso(buffers.n, max(total, buffers.n))
+            finally:
+                cursor.close()
+        except Exception as e:
+            raise Exception(f"Erro ao buscar dados: {e}")
+    
+    with medir('banco.carga_montagem'):
+        return buffers.montar()
+
+class _BuffersColunas:
+    """Um array por coluna para `capacidade` linhas, preenchido lote a lote (texto repetitivo já como códigos de categoria)"""
+    
+    def __init__(self, capacidade):
+        self.capacidade = max(capacidade, 1)
+        self.n = 0
+        self.colunas = []
+        self._arrays = {}
+        self._categorias = {}  # coluna categórica -> valores na ordem dos códigos (pd.Index)
+    
+    def definir_colunas(self, colunas):
+        self.colunas = colunas
+        for col in colunas:
+            if col in COLUNAS_CATEGORICAS:
+                self._arrays[col] = np.empty(self.capacidade, dtype=np.int32)
+                self._categorias[col] = pd.Index([], dtype=object)
+            elif col in COLUNAS_FLOAT32:
+                self._arrays[col] = np.empty(self.capacidade, dtype=np.float32)
+            elif col in COLUNAS_INTEIRAS or col in ('latitude', 'longitude'):
+                # Inteiros passam por float64 (aceita nulos) e são reduzidos no fim
+                self._arrays[col] = np.empty(self.capacidade, dtype=np.float64)
+            # data_hora e texto livre: alocados no primeiro lote, com o dtype convertido
+    
+    def _converter(self, col, valores):
+        if col in COLUNAS_CATEGORICAS:
+            # Códigos do lote (nulo = -1) traduzidos para os códigos acumulados da coluna
+            codigos, valores_lote = pd.factorize(np.array(valores, dtype=object))
+            conhecidos = self._categorias[col]
+            novos = valores_lote[conhecidos.get_indexer(valores_lote) < 0]
+            if len(novos):
+                conhecidos = self._categorias[col] = conhecidos.append(pd.Index(novos, dtype=object))
+            traducao = np.append(conhecidos.get_indexer(valores_lote), -1).astype(np.int32)
+            return traducao[codigos]
+        if col == 'data_hora':
+            with medir('banco.conversao_datas'):
+                return pd.to_datetime(pd.Series(valores, dtype=object)).to_numpy()
+        if col in self._arrays and self._arrays[col].dtype.kind == 'f':
+            return np.array(valores, dtype=self._arrays[col].dtype)
+        return np.array(valores, dtype=object)
+    
+    def _crescer(self, minimo):
+        # Linhas inseridas entre o COUNT e o SELECT: dobra a capacidade
+        self.capacidade = max(minimo, 2 * self.capacidade)
+        for col, array in self._arrays.items():
+            novo = np.empty(self.capacidade, dtype=array.dtype)
+            novo[:self.n] = array[:self.n]
+            self._arrays[col] = novo
+    
+    def adicionar(self, linhas):
+        fim = self.n + len(linhas)
+        if fim > self.capacidade:
+            self._crescer(fim)
+        for col, valores in zip(self.colunas, zip(*linhas)):
+            convertido = self._converter(col, valores)
+            if col not in self._arrays:
+                self._arrays[col] = np.empty(self.capacidade, dtype=convertido.dtype)
+            self._arrays[col][self.n:fim] = convertido
+        self.n = fim
+    
+    def montar(self):
+        """Frame final (com local_categoria), sem cópias além das dos arrays aparados"""
+        dados = {}
+        for col in self.colunas:
+            # Cada buffer sai do dicionário ao virar coluna: não fica vivo junto com o frame
+            array = self._arrays.pop(col, None)
+            if array is None:  # nenhum lote lido
+                array = np.empty(0, dtype='datetime64[ns]' if col == 'data_hora' else object)
+            array = array[:self.n]
+            if col in COLUNAS_CATEGORICAS:
+                dados[col] = self._categorica(array, list(self._categorias[col]))
+            elif col in COLUNAS_INTEIRAS:
+                # Mesma regra de _aplicar_esquema: com nulos fica float32
+                dados[col] = array.astype(np.float32) if np.isnan(array).any() else pd.to_numeric(array, downcast='integer')
+            else:
+                dados[col] = array
+        # copy=False: as colunas são os próprios arrays (sem consolidar em blocos novos)
+        df = pd.DataFrame(dados, columns=self.colunas, copy=False)
+        del dados
+        
+        # local_categoria sai das descrições distintas, não das linhas (código -1, nulo, vira 'Outros')
+        descricoes = df['descricao_local'].cat
+        with medir('banco.categorizacao'):
+            rotulos = np.append(categorizar_locais(pd.Series(descricoes.categories)).to_numpy(dtype=object), 'Outros')
+        categorias, codigos = np.unique(rotulos.astype(str), return_inverse=True)
+        df['local_categoria'] = pd.Categorical.from_codes(
+            codigos[descricoes.codes.to_numpy()], categories=pd.Index(categorias.tolist())
+        ).remove_unused_categories()
+        return derivar_colunas(df)
+    
+    @staticmethod
+    def _categorica(codigos, valores):
+        """Categorical com as categorias ordenadas, como astype('category')"""
+        categorias = pd.Index(valores, dtype=object)
+        ordem = categorias.argsort()
+        recodificar = np.empty(len(categorias) + 1, dtype=np.int32)
+        recodificar[ordem] = np.arange(len(categorias), dtype=np.int32)
+        recodificar[-1] = -1
+        return pd.Categorical.from_codes(recodificar[codigos], categories=pd.Index(categorias[ordem].tolist()))
+
+@cronometrado('banco.blocos')
+def _checksums_blocos():
+    """Contagem e checksum de cada bloco de coleta_ids de COLETAS (índice: bloco)"""
+    with conexao() as connection:
+        try:
+            blocos = pd.read_sql(_QUERY_BLOCOS, connection, params=(BLOCO_IDS,))
+        except Exception as e:
+            raise Exception(f"Erro ao buscar dados: {e}")
+    return blocos.astype({'bloco': np.int64, 'linhas': np.int64, 'soma': np.int64}).set_index('bloco')
+
+def _blocos_alterados(anteriores, atuais):
+    """Blocos novos, removidos ou com contagem/checksum diferente"""
+    comparados = atuais.join(anteriores, how='outer', rsuffix='_anterior')
+    mudou = (comparados['linhas'] != comparados['linhas_anterior']) | (comparados['soma'] != comparados['soma_anterior'])
+    return comparados.index[mudou.to_numpy()].to_numpy()
+
+@cronometrado('banco.delta')
+def _buscar_delta(blocos):
+    """Linhas atuais dos blocos de coleta_ids informados (inclui edições e inserções retroativas)"""
+    # Blocos consecutivos viram um único intervalo de coleta_id
+    blocos = np.sort(blocos)
+    quebras = np.flatnonzero(np.diff(blocos) != 1) + 1
+    intervalos = [(int(trecho[0]) * BLOCO_IDS, (int(trecho[-1]) + 1) * BLOCO_IDS - 1) for trecho in np.split(blocos, quebras)]
+    query = _QUERY_DADOS + "WHERE " + " OR ".join(["c.coleta_id BETWEEN %s AND %s"] * len(intervalos)) + """
     ORDER BY c.data_hora DESC
     """
     
-    connection = get_connection()
+    with conexao() as connection:
+        try:
+            novos = pd.read_sql(query, connection, params=[limite for intervalo in intervalos for limite in intervalo])
+            novos['data_hora'] = pd.to_datetime(novos['data_hora'])
+            return novos
+        except Exception as e:
+            raise Exception(f"Erro ao buscar dados: {e}")
+
+def _mesclar_delta(df, novos, blocos):
+    """Troca as linhas dos blocos alterados pelas buscadas; retorna (frame, linhas descartadas) ou (None, None)"""
+    manter = ~np.isin(df['coleta_id'].to_numpy() // BLOCO_IDS, blocos)
+    if novos.empty and manter.all():
+        return None, None
+    
+    antigos = df[manter]
+    descartados = df[~manter]
+    partes = [parte for parte in (novos, antigos) if not parte.empty]
+    if not partes:
+        return df.iloc[0:0], descartados
+    mesclado = pd.concat(_alinhar_categorias(partes), ignore_index=True)
+    
+    # O delta vem ordenado; só reordena se alguma linha nova for mais antiga que as existentes
+    if not novos.empty and not antigos.empty and novos['data_hora'].min() < antigos['data_hora'].max():
+        mesclado = mesclado.sort_values('data_hora', ascending=False, kind='stable', ignore_index=True)
+    return mesclado, descartados
+
+def _preparar(df):
+    """Frame lido pelo read_sql no formato do cache: enriquecido, compacto e com as colunas derivadas"""
+    return derivar_colunas(_aplicar_esquema(_enriquecer(df)))
+
+def _carga_completa(progresso=None):
+    """Consulta completa já preparada (local_categoria, colunas derivadas e dtypes compactos); não usa o lock"""
+    df = carregar_em_lotes(progresso)
+    return df, _memoria_sem_esquema(df)
+
+def _memoria_sem_esquema(df):
+    """Memória que o frame ocuparia com os dtypes padrão do read_sql (categóricas decodificadas uma coluna por vez)"""
+    total = df.index.memory_usage()
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            total += serie.astype(serie.cat.categories.dtype).memory_usage(deep=True, index=False)
+        elif serie.dtype.kind in 'fiubM':
+            total += 8 * len(serie)
+        else:
+            total += serie.memory_usage(deep=True, index=False)
+    return int(total)
+
+def _instalar(df, origem='banco', alteracao=None):
+    """Publica um novo frame para todas as sessões (chamar com _sync_lock); `alteracao` = (novas, descartadas) de um delta"""
+    _sync['df'] = df
+    _sync['versao'] += 1
+    if alteracao is None:
+        _sync['alteracoes'].clear()
+    else:
+        _sync['alteracoes'].append((_sync['versao'],) + alteracao)
+    _cache['memoria_bytes'] = int(df.memory_usage(deep=True).sum())
+    _cache['origem'] = origem
+    if origem == 'banco':
+        _cache['erro'] = None
+        _snapshot['salvo_em'] = None
+        _agendar_snapshot(df)
+
+@cronometrado('banco.assinatura')
+def assinatura_dados():
+    """Assinatura barata do banco: contagens, máximos e checksum das coletas recentes (COLETAS) e de FOTOS"""
+    with conexao() as connection:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(_QUERY_ASSINATURA, (JANELA_EDICOES_IDS,))
+                max_id, n_coletas, max_data, soma_recentes, n_fotos, max_id_fotos = cursor.fetchone()
+        except Exception as e:
+            raise Exception(f"Erro ao buscar dados: {e}")
+    return {'coletas': (max_id, n_coletas, str(max_data), soma_recentes), 'fotos': (n_fotos, max_id_fotos)}
+
+@cronometrado('banco.sincronizar')
+def sincronizar_dados(forcar_completa=False, progresso=None):
+    """Dados atualizados; fora da recarga completa periódica busca só os blocos de coleta_ids alterados"""
+    with _atualizacao_lock:
+        with _sync_lock:
+            df_atual = _sync['df']
+            blocos_anteriores = _sync['blocos']
+            ultima_completa = _sync['ultima_recarga_completa']
+        
+        if df_atual is None and not forcar_completa:
+            df = ler_snapshot()
+            if df is not None:
+                divergencias = conferir_derivadas(df)
+                with _sync_lock:
+                    _instalar(df, origem='snapshot')
+                    _cache['divergencias'] = divergencias
+                _acordar_atualizador()
+                return df
+        
+        agora = time.monotonic()
+        completa = (
+            forcar_completa
+            or df_atual is None
+            or ultima_completa is None
+            or blocos_anteriores is None
+            or agora - ultima_completa >= RECARGA_COMPLETA_S
+        )
+        
+        # Assinatura e blocos lidos antes das consultas: o que mudar durante elas aparece na próxima verificação
+        assinatura = assinatura_dados()['coletas']
+        blocos = _checksums_blocos()
+        if completa:
+            df, memoria_sem_esquema = _carga_completa(progresso)
+        else:
+            alterados = _blocos_alterados(blocos_anteriores, blocos)
+            df = None
+            if len(alterados):
+                novos = _preparar(_buscar_delta(alterados))
+                df, descartados = _mesclar_delta(df_atual, novos, alterados)
+        
+        divergencias = conferir_derivadas(df) if df is not None else None
+        
+        with _sync_lock:
+            if completa:
+                _cache['memoria_bytes_sem_esquema'] = memoria_sem_esquema
+                _sync['ultima_recarga_completa'] = agora
+            if df is not None:
+                _instalar(df, alteracao=None if completa else (novos, descartados))
+                _cache['divergencias'] = divergencias
+            _sync['assinatura'] = assinatura
+            _sync['blocos'] = blocos
+            _cache['erro'] = None
+            _cache['carregado_em'] = time.monotonic()
+            return _sync['df']
+
+@cronometrado('banco.carregar_dados')
+def carregar_dados(progresso=None):
+    """Retorna (df, versao) do frame compartilhado entre as sessões (não modificar); só consulta o banco no início a frio"""
+    with _sync_lock:
+        df, versao = _sync['df'], _sync['versao']
+        if df is not None:
+            _cache['hits'] += 1
+    if df is None:
+        with _atualizacao_lock:
+            # Outra sessão pode ter carregado enquanto esta esperava
+            with _sync_lock:
+                df, versao = _sync['df'], _sync['versao']
+            if df is None:
+                with _sync_lock:
+                    _cache['misses'] += 1
+                sincronizar_dados(progresso=progresso)
+                # Ainda com _atualizacao_lock: o atualizador não publica entre a carga e esta leitura
+                with _sync_lock:
+                    df, versao = _sync['df'], _sync['versao']
+    _garantir_atualizador()
+    return df, versao
+
+def verificar_mudancas():
+    """Uma rodada do atualizador: sincroniza se a assinatura do banco mudou; retorna True se publicou dados novos"""
+    assinatura = assinatura_dados()
+    with _sync_lock:
+        ultima_completa = _sync['ultima_recarga_completa']
+        vencida = ultima_completa is None or time.monotonic() - ultima_completa >= RECARGA_COMPLETA_S
+        mudou = vencida or assinatura['coletas'] != _sync['assinatura']
+        versao = _sync['versao']
+    
+    if mudou:
+        sincronizar_dados()
+        _atualizador['sincronizacoes'] += 1
+    
+    _atualizador['ultima_assinatura_fotos'] = assinatura['fotos']
+    if _fotos['df'] is not None and assinatura['fotos'] != _fotos['assinatura']:
+        with _fotos_lock:
+            fotos = get_fotos()
+            _fotos.update(df=fotos, carregado_em=time.monotonic(), assinatura=assinatura['fotos'])
+        _agendar_snapshot(fotos.reset_index(), _caminho_fotos())
+    
+    with _sync_lock:
+        _cache['erro'] = None
+        _cache['carregado_em'] = time.monotonic()
+        return _sync['versao'] != versao
+
+def _laco_atualizador(parar):
+    while True:
+        _atualizador['acordar'].wait(CACHE_TTL_S)
+        _atualizador['acordar'].clear()
+        if parar.is_set():
+            return
+        try:
+            verificar_mudancas()
+        except Exception as e:
+            # Banco fora do ar: as páginas seguem com o último frame (do banco ou do snapshot)
+            with _sync_lock:
+                _cache['erro'] = str(e)
+        _atualizador['verificacoes'] += 1
+        _atualizador['ultima_verificacao'] = time.monotonic()
+
+def _garantir_atualizador():
+    """Inicia o atualizador do processo, se ainda não estiver rodando"""
+    with _atualizador_lock:
+        thread = _atualizador['thread']
+        if thread is not None and thread.is_alive():
+            return
+        parar = threading.Event()
+        thread = threading.Thread(target=_laco_atualizador, args=(parar,), name='atualizador-dados', daemon=True)
+        _atualizador.update(thread=thread, parar=parar)
+        thread.start()
+
+def _acordar_atualizador():
+    """Antecipa a próxima verificação (usado após servir o snapshot no início a frio)"""
+    _garantir_atualizador()
+    _atualizador['acordar'].set()
+
+def _parar_atualizador():
+    with _atualizador_lock:
+        if _atualizador['parar'] is not None:
+            _atualizador['parar'].set()
+            _atualizador['acordar'].set()
+        _atualizador.update(thread=None, parar=None)
+
+def estatisticas_cache():
+    """Hits, misses e memória ocupada pelo cache de dados"""
+    with _sync_lock:
+        df = _sync['df']
+        carregado_em = _cache['carregado_em']
+        pedidos = _cache['hits'] + _cache['misses']
+        return {
+            'hits': _cache['hits'],
+            'misses': _cache['misses'],
+            'taxa_hits': _cache['hits'] / pedidos if pedidos else 0.0,
+            'linhas': len(df) if df is not None else 0,
+            'memoria_bytes': _cache['memoria_bytes'],
+            # Memória do mesmo frame com os dtypes padrão do read_sql (medida na última recarga completa)
+            'memoria_bytes_sem_esquema': _cache['memoria_bytes_sem_esquema'],
+            'versao': _sync['versao'],
+            'idade_s': time.monotonic() - carregado_em if carregado_em is not None else None,
+            'origem': _cache['origem'],
+            'erro': _cache['erro'],
+            'snapshot_salvo_em': _snapshot['salvo_em'],
+            # Linhas em que H+, OH- ou o ponto de orvalho do banco diferem do calculado
+            'divergencias_derivadas': _cache['divergencias'],
+            'verificacoes': _atualizador['verificacoes'],
+            'sincronizacoes': _atualizador['sincronizacoes'],
+        }
+
+# ==================== SNAPSHOT LOCAL (INÍCIO A FRIO E MODO OFFLINE) ====================
+
+@cronometrado('snapshot.gravacao')
+def gravar_snapshot(df, caminho=None):
+    """Grava o frame em Arrow IPC sem compressão (lido depois com memory map)"""
+    caminho = caminho or SNAPSHOT_CAMINHO
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f"{caminho}.{threading.get_ident()}.tmp"
+    feather.write_feather(df, temporario, compression='uncompressed')
+    os.replace(temporario, caminho)
+
+@cronometrado('snapshot.leitura')
+def ler_snapshot(caminho=None):
+    """Frame do snapshot local, ou None se não houver (ou se estiver ilegível)"""
+    caminho = caminho or SNAPSHOT_CAMINHO
+    if not caminho or feather is None or not os.path.exists(caminho):
+        return None
     try:
-        df = pd.read_sql(query, connection)
-        df['data_hora'] = pd.to_datetime(df['data_hora'])
-        return df
-    except Exception as e:
-        raise Exception(f"Erro ao buscar dados: {e}")
-    finally:
-        connection.close()
+        df = feather.read_table(caminho, memory_map=True).to_pandas()
+    except Exception:
+        return None
+    _snapshot['salvo_em'] = pd.Timestamp(os.path.getmtime(caminho), unit='s', tz='UTC').tz_convert(None)
+    # Snapshot gravado antes das colunas de classificação existirem
+    if not set(CLASSES).issubset(df.columns):
+        df = derivar_colunas(df)
+    return df
+
+def _caminho_fotos():
+    """Snapshot da tabela de fotos, ao lado do snapshot das coletas"""
+    if not SNAPSHOT_CAMINHO:
+        return None
+    base, extensao = os.path.splitext(SNAPSHOT_CAMINHO)
+    return f"{base}.fotos{extensao}"
+
+def ler_snapshot_fotos():
+    """Tabela de fotos do snapshot local (mesmo formato de get_fotos), ou None"""
+    caminho = _caminho_fotos()
+    if not caminho or feather is None or not os.path.exists(caminho):
+        return None
+    try:
+        return feather.read_table(caminho, memory_map=True).to_pandas().set_index('coleta_id')
+    except Exception:
+        return None
+
+def _agendar_snapshot(df, caminho=None):
+    """Grava o frame numa thread; se já houver gravação em curso, só o frame mais novo de cada caminho é gravado"""
+    caminho = caminho or SNAPSHOT_CAMINHO
+    if not caminho or feather is None:
+        return
+    with _snapshot_lock:
+        _snapshot['pendente'][caminho] = df
+        if _snapshot['gravando']:
+            return
+        _snapshot['gravando'] = True
+    threading.Thread(target=_gravar_pendentes, name='snapshot-dados', daemon=True).start()
+
+def _gravar_pendentes():
+    while True:
+        with _snapshot_lock:
+            if not _snapshot['pendente']:
+                _snapshot['gravando'] = False
+                return
+            caminho, df = _snapshot['pendente'].popitem()
+        try:
+            gravar_snapshot(df, caminho)
+        except Exception:
+            pass  # sem snapshot o próximo início a frio só fica mais lento
+
+@cronometrado('banco.fotos')
+def get_fotos():
+    """Busca a tabela de fotos, ordenada e indexada por coleta_id"""
+    query = "SELECT coleta_id, url_foto FROM FOTOS ORDER BY coleta_id"
+    
+    with conexao() as connection:
+        try:
+            fotos = pd.read_sql(query, connection)
+        except Exception as e:
+            raise Exception(f"Erro ao buscar fotos: {e}")
+    fotos['url_foto_view'] = fotos['url_foto'].apply(converter_url_drive)
+    return fotos.set_index('coleta_id')
+
+def carregar_fotos():
+    """Retorna a tabela de fotos (índice coleta_id; colunas url_foto e url_foto_view), buscada só quando necessária"""
+    fotos = _fotos['df']
+    if fotos is not None:
+        return fotos
+    with _fotos_lock:
+        if _fotos['df'] is None:
+            try:
+                fotos, assinatura = get_fotos(), _atualizador['ultima_assinatura_fotos']
+                _agendar_snapshot(fotos.reset_index(), _caminho_fotos())
+            except Exception:
+                # Banco fora do ar: fotos do snapshot, trocadas pelas do banco quando ele voltar
+                fotos, assinatura = ler_snapshot_fotos(), None
+                if fotos is None:
+                    raise
+            _fotos.update(df=fotos, carregado_em=time.monotonic(), assinatura=assinatura)
+        return _fotos['df']
+
+def fotos_da_coleta(coleta_id):
+    """Fotos de uma coleta (busca binária no índice ordenado de carregar_fotos)"""
+    fotos = carregar_fotos()
+    inicio, fim = fotos.index.slice_locs(coleta_id, coleta_id)
+    return fotos.iloc[inicio:fim]
+
+def alteracoes_desde(desde, ate):
+    """(linhas novas, descartadas) dos deltas das versões em (desde, ate], ou None se faltar algum"""
+    with _sync_lock:
+        if desde == ate:
+            return []
+        alteracoes = [a for a in _sync['alteracoes'] if desde < a[0] <= ate]
+        # Uma carga completa no meio (ou o histórico esgotado) deixa buracos na sequência
+        if len(alteracoes) != ate - desde or alteracoes[0][0] != desde + 1:
+            return None
+        return [(novos, descartados) for _, novos, descartados in alteracoes]
+
+# ==================== MODO SERVIDOR (FILTRO E AGREGAÇÃO NO BANCO) ====================
+
+COLUNAS_MEDIAS = ['ph', 'temp_agua_c', 'temp_ar_c', 'umidade_ar_perc']
+# Mesma junção da carga (_QUERY_DADOS) em todas as consultas: coletas sem local válido
+# ficam de fora do total, das médias e das contagens, como no frame em memória
+_FROM_COLETAS = "FROM COLETAS c INNER JOIN LOCAIS l ON c.local_id = l.local_id"
+
+def _locais_da_categoria(connection, local_categoria):
+    """local_ids cuja descrição cai na categoria (LOCAIS é pequena; a categoria só existe em Python)"""
+    locais = pd.read_sql("SELECT local_id, descricao_local FROM LOCAIS", connection)
+    return locais.loc[categorizar_locais(locais['descricao_local']) == local_categoria, 'local_id'].tolist()
+
+def _filtro_sql(data_inicio, data_fim, local_ids=None, carac_ph=None):
+    """Monta a cláusula WHERE parametrizada dos filtros da sidebar"""
+    condicoes = ["c.data_hora >= %s", "c.data_hora < %s"]
+    params = [
+        pd.Timestamp(data_inicio).strftime('%Y-%m-%d %H:%M:%S'),
+        (pd.Timestamp(data_fim) + pd.Timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'),
+    ]
+    if local_ids is not None:
+        condicoes.append(f"c.local_id IN ({', '.join(['%s'] * len(local_ids))})")
+        params.extend(int(i) for i in local_ids)
+    if carac_ph is not None:
+        condicoes.append(f"c.carac_ph IN ({', '.join(['%s'] * len(carac_ph))})")
+        params.extend(carac_ph)
+    return " WHERE " + " AND ".join(condicoes), params
+
+@cronometrado('banco.consultar_resumo')
+def consultar_resumo(data_inicio, data_fim, local_categoria=None, carac_ph=None, nbins=15):
+    """Total, médias, contagens de pH e local e histograma de turbidez (`nbins` faixas) calculados no banco"""
+    with conexao() as connection:
+        try:
+            local_ids = None
+            if local_categoria is not None:
+                local_ids = _locais_da_categoria(connection, local_categoria)
+            if local_ids == [] or carac_ph == []:
+                return _resumo_vazio()
+            where, params = _filtro_sql(data_inicio, data_fim, local_ids, carac_ph)
+            
+            medias_sql = ", ".join(f"AVG(c.{col}) AS {col}" for col in COLUNAS_MEDIAS)
+            totais = pd.read_sql(
+                f"SELECT COUNT(*) AS total, {medias_sql}, MIN(c.turbidez_ntu) AS turb_min, "
+                f"MAX(c.turbidez_ntu) AS turb_max {_FROM_COLETAS}{where}",
+                connection, params=params
+            ).iloc[0]
+            if not totais['total']:
+                return _resumo_vazio()
+            
+            contagem_ph = pd.read_sql(
+                f"SELECT c.carac_ph, COUNT(*) AS quantidade {_FROM_COLETAS}{where} GROUP BY c.carac_ph",
+                connection, params=params
+            ).set_index('carac_ph')['quantidade'].sort_values(ascending=False)
+            
+            por_local = pd.read_sql(
+                f"SELECT l.descricao_local, COUNT(*) AS quantidade {_FROM_COLETAS}{where} "
+                f"GROUP BY l.local_id, l.descricao_local",
+                connection, params=params
+            )
+            contagem_local = (
+                por_local.groupby(categorizar_locais(por_local['descricao_local']))['quantidade']
+                .sum().sort_values(ascending=False).rename_axis('local_categoria')
+            )
+            
+            histograma = _histograma_sql(connection, where, params, totais['turb_min'], totais['turb_max'], nbins)
+        except Exception as e:
+            raise Exception(f"Erro ao buscar dados: {e}")
+    
+    return {
+        'total': int(totais['total']),
+        'medias': {col: float(totais[col]) if pd.notna(totais[col]) else float('nan') for col in COLUNAS_MEDIAS},
+        'contagem_ph': contagem_ph,
+        'contagem_local': contagem_local,
+        'histograma_turbidez': histograma,
+    }
+
+def _histograma_sql(connection, where, params, minimo, maximo, nbins):
+    """Histograma de turbidez com faixas de mesma largura, contado pelo banco"""
+    if pd.isna(minimo):
+        return pd.DataFrame({'inicio': [], 'fim': [], 'quantidade': []})
+    minimo, maximo = float(minimo), float(maximo)
+    largura = (maximo - minimo) / nbins if maximo > minimo else 1.0
+    
+    contagens = pd.read_sql(
+        f"SELECT FLOOR((c.turbidez_ntu - %s) / %s) AS faixa, COUNT(*) AS quantidade "
+        f"{_FROM_COLETAS}{where} AND c.turbidez_ntu IS NOT NULL GROUP BY faixa",
+        connection, params=[minimo, largura] + params
+    )
+    # O valor máximo cai em faixa == nbins; ele pertence à última faixa (fechada)
+    faixas = contagens['faixa'].astype(int).clip(upper=nbins - 1)
+    quantidade = np.bincount(faixas, weights=contagens['quantidade'], minlength=nbins).astype(int)
+    inicio = minimo + largura * np.arange(nbins)
+    return pd.DataFrame({'inicio': inicio, 'fim': inicio + largura, 'quantidade': quantidade})
+
+def _resumo_vazio():
+    return {
+        'total': 0,
+        'medias': {col: float('nan') for col in COLUNAS_MEDIAS},
+        'contagem_ph': pd.Series(dtype=int),
+        'contagem_local': pd.Series(dtype=int),
+        'histograma_turbidez': pd.DataFrame({'inicio': [], 'fim': [], 'quantidade': []}),
+    }
+
+# Dtypes aplicados na carga: categorias para texto de baixa cardinalidade e float32 para
+# leituras de sensores. latitude/longitude continuam float64 (float32 perde precisão de GPS)
+# e descricao_amostra, texto livre, continua object.
+COLUNAS_CATEGORICAS = ['carac_ph', 'descricao_local', 'local_categoria']
+COLUNAS_FLOAT32 = ['ph', 'temp_agua_c', 'temp_ar_c', 'umidade_ar_perc', 'h_ion_conc', 'oh_ion_conc', 'ponto_orvalho_c']
+COLUNAS_INTEIRAS = ['coleta_id', 'turbidez_ntu']
+
+def _aplicar_esquema(df):
+    """Converte as colunas para os dtypes compactos do cache"""
+    for col in COLUNAS_CATEGORICAS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in COLUNAS_FLOAT32:
+        if col in df.columns:
+            df[col] = df[col].astype('float32')
+    for col in COLUNAS_INTEIRAS:
+        if col in df.columns:
+            # Com nulos não há inteiro compacto sem máscara; fica float32
+            if df[col].isna().any():
+                df[col] = df[col].astype('float32')
+            else:
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+def _alinhar_categorias(partes):
+    """Dá às colunas categóricas das partes as mesmas categorias, para o concat não virar object"""
+    dtypes = {}
+    for col in partes[0].columns:
+        if all(isinstance(parte[col].dtype, pd.CategoricalDtype) for parte in partes):
+            categorias = partes[0][col].cat.categories
+            for parte in partes[1:]:
+                categorias = categorias.union(parte[col].cat.categories)
+            dtypes[col] = pd.CategoricalDtype(categorias)
+    return [parte.astype(dtypes) for parte in partes] if dtypes else partes
+
+# ==================== COLUNAS DERIVADAS ====================
+
+# pKw da água a 25 °C e constantes de Magnus (Alduchov & Eskridge) para o ponto de orvalho
+PKW = 14.0
+MAGNUS_B = 17.62
+MAGNUS_C = 243.12
+COLUNAS_QUIMICAS = ['h_ion_conc', 'oh_ion_conc', 'ponto_orvalho_c']
+
+# Limites das classificações: acima deles a turbidez é Alta e a água, Aquecida
+LIMITE_TURBIDEZ_NTU = 100
+LIMITE_TEMP_AGUA_C = 25
+
+# Tolerâncias da conferência entre o valor guardado no banco e o calculado
+TOLERANCIA_CONCENTRACAO = 1e-3  # relativa
+TOLERANCIA_ORVALHO_C = 0.5
+
+# Colunas de classificação -> categorias, na ordem dos códigos
+CLASSES = {
+    'classe_turbidez': ['Baixa', 'Alta'],
+    'classe_temp_agua': ['Normal', 'Aquecida'],
+    'classe_ph': ['Ácido', 'Neutro', 'Básico'],
+}
+
+def _float64(df, col):
+    return df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+def calcular_quimica(ph, temp_ar_c, umidade_ar_perc):
+    """[H⁺] e [OH⁻] (mol/L) a partir do pH e ponto de orvalho (°C) pela fórmula de Magnus; entradas nulas dão NaN"""
+    h_ion = 10.0 ** -ph
+    oh_ion = 10.0 ** (ph - PKW)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gama = np.log(umidade_ar_perc / 100.0) + MAGNUS_B * temp_ar_c / (MAGNUS_C + temp_ar_c)
+        orvalho = np.where(umidade_ar_perc > 0, MAGNUS_C * gama / (MAGNUS_B - gama), np.nan)
+    return h_ion, oh_ion, orvalho
+
+def _quimica_do_frame(df):
+    valores = calcular_quimica(_float64(df, 'ph'), _float64(df, 'temp_ar_c'), _float64(df, 'umidade_ar_perc'))
+    return dict(zip(COLUNAS_QUIMICAS, valores))
+
+def _classe(nome, codigos, nulos):
+    return pd.Categorical.from_codes(np.where(nulos, -1, codigos).astype(np.int8), categories=CLASSES[nome])
+
+@cronometrado('banco.derivadas')
+def derivar_colunas(df):
+    """Completa [H⁺], [OH⁻] e ponto de orvalho ausentes e adiciona classe_turbidez, classe_temp_agua e classe_ph"""
+    for col, calculado in _quimica_do_frame(df).items():
+        if col in df.columns:
+            guardado = _float64(df, col)
+            calculado = np.where(np.isnan(guardado), calculado, guardado)
+        df[col] = calculado.astype(np.float32)
+    
+    turbidez = _float64(df, 'turbidez_ntu')
+    df['classe_turbidez'] = _classe('classe_turbidez', turbidez > LIMITE_TURBIDEZ_NTU, np.isnan(turbidez))
+    temp_agua = _float64(df, 'temp_agua_c')
+    df['classe_temp_agua'] = _classe('classe_temp_agua', temp_agua > LIMITE_TEMP_AGUA_C, np.isnan(temp_agua))
+    # carac_ph vem do banco; qualquer valor fora de Ácido/Neutro conta como Básico, como na página de detalhes
+    carac_ph = df['carac_ph']
+    codigos = np.select([carac_ph.eq('Ácido').to_numpy(bool), carac_ph.eq('Neutro').to_numpy(bool)], [0, 1], 2)
+    df['classe_ph'] = _classe('classe_ph', codigos, carac_ph.isna().to_numpy())
+    return df
+
+def conferir_derivadas(df):
+    """Por coluna, quantas linhas guardadas no banco diferem do valor calculado além da tolerância"""
+    divergencias = {}
+    for col, calculado in _quimica_do_frame(df).items():
+        guardado = _float64(df, col)
+        comparaveis = ~np.isnan(calculado) & ~np.isnan(guardado)
+        if col == 'ponto_orvalho_c':
+            proximos = np.isclose(guardado, calculado, rtol=0, atol=TOLERANCIA_ORVALHO_C)
+        else:
+            proximos = np.isclose(guardado, calculado, rtol=TOLERANCIA_CONCENTRACAO, atol=0)
+        divergencias[col] = int((comparaveis & ~proximos).sum())
+    return divergencias
+
+@cronometrado('banco.categorizacao')
+def _enriquecer(df):
+    """Adiciona as colunas derivadas usadas pelas páginas"""
+    df['local_categoria'] = categorizar_locais(df['descricao_local'])
+    return df
 
 def extrair_local_categoria(descricao):
     """Extrai a categoria do local baseado na descrição - com correspondência exata"""
@@ -77,6 +1113,13 @@ def extrair_local_categoria(descricao):
     else:
         return 'Outros'
 
+def categorizar_locais(descricoes):
+    """Versão vetorizada de extrair_local_categoria: classifica cada descrição distinta uma única vez"""
+    codigos, distintos = pd.factorize(descricoes)
+    # Código -1 (valor nulo) cai na última posição: 'Outros'
+    categorias = np.array([extrair_local_categoria(d) for d in distintos] + ['Outros'], dtype=object)
+    return pd.Series(categorias[codigos], index=descricoes.index, name=descricoes.name)
+
 def converter_url_drive(url):
     """Converte URL do Google Drive para formato de visualização direta"""
     if pd.isna(url):
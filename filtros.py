@@ -0,0 +1,193 @@
+"""
+Motor de filtragem do dashboard
+Combina os filtros da sidebar e os filtros cruzados dos gráficos como máscaras booleanas,
+sem copiar o DataFrame a cada etapa
+"""
+import hashlib
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from mapa import IndiceEspacial
+
+
+@dataclass
+class ResultadoFiltro:
+    """Máscaras sobre o frame original; as linhas só são copiadas quando alguém pede"""
+    mascara_base: np.ndarray          # só filtros da sidebar
+    mascara: np.ndarray               # sidebar + filtros cruzados dos gráficos
+    filtros_ativos: list = field(default_factory=list)
+    tempos: dict = field(default_factory=dict)  # etapa -> segundos
+    cat_ph: object = None             # categoria escolhida na pizza
+    cat_local: object = None          # categoria escolhida na barra
+    selecao_linhas: bool = False      # há seleção de linhas específicas (dispersão/mapa)
+
+    @property
+    def indices(self):
+        """Posições (iloc) das linhas que passaram em todos os filtros"""
+        return np.flatnonzero(self.mascara)
+
+    @property
+    def total(self):
+        return int(self.mascara.sum())
+
+    def assinatura(self):
+        """Hash da máscara final: filtros que chegam às mesmas linhas têm a mesma assinatura"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(len(self.mascara).to_bytes(8, 'little'))
+        h.update(np.packbits(self.mascara).tobytes())
+        return h.hexdigest()
+
+    def linhas(self, df):
+        """Materializa as linhas filtradas (uma única cópia) e registra o tempo gasto"""
+        inicio = time.perf_counter()
+        linhas = df.iloc[self.indices]
+        self.tempos['materializacao'] = time.perf_counter() - inicio
+        return linhas
+
+
+def mascara_sidebar(df, local_selecionado, ph_selecionado, data_inicio, data_fim):
+    """Máscara dos filtros da sidebar: local, características do pH e período (datas inclusivas)"""
+    # Compara datetime64 direto com os limites do período, sem criar objetos date por linha
+    data_hora = df['data_hora'].to_numpy()
+    inicio = pd.Timestamp(data_inicio).to_datetime64()
+    fim = (pd.Timestamp(data_fim) + pd.Timedelta(days=1)).to_datetime64()
+    mascara = (data_hora >= inicio) & (data_hora < fim)
+
+    if local_selecionado != 'Todos':
+        mascara &= (df['local_categoria'] == local_selecionado).to_numpy()
+
+    if 'Todas' not in ph_selecionado:
+        mascara &= df['carac_ph'].isin(ph_selecionado).to_numpy()
+
+    return mascara
+
+
+def _dentro_poligono(x, y, px, py):
+    """Teste par-ímpar (ray casting) vetorizado: pontos (x, y) dentro do polígono (px, py)"""
+    dentro = np.zeros(len(x), dtype=bool)
+    # Só testa os pontos dentro do retângulo envolvente do polígono
+    candidatos = np.flatnonzero((x >= px.min()) & (x <= px.max()) & (y >= py.min()) & (y <= py.max()))
+    xc, yc = x[candidatos], y[candidatos]
+    impar = np.zeros(len(candidatos), dtype=bool)
+    for i in range(len(px)):
+        x1, y1, x2, y2 = px[i - 1], py[i - 1], px[i], py[i]
+        cruza = (y1 > yc) != (y2 > yc)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_corte = x1 + (yc - y1) * (x2 - x1) / (y2 - y1)
+        impar ^= cruza & (xc < x_corte)
+    dentro[candidatos] = impar
+    return dentro
+
+
+def pontos_na_regiao(x, y, selecao):
+    """Máscara dos pontos (x, y) dentro das caixas ou laços de uma seleção do plotly"""
+    dentro = np.zeros(len(x), dtype=bool)
+    for caixa in selecao.get("box", []):
+        x0, x1 = sorted(caixa["x"][:2])
+        y0, y1 = sorted(caixa["y"][:2])
+        dentro |= (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+    for laco in selecao.get("lasso", []):
+        dentro |= _dentro_poligono(x, y, np.asarray(laco["x"], dtype=float), np.asarray(laco["y"], dtype=float))
+    return dentro
+
+
+def _selecao(estado_sessao, chave):
+    return estado_sessao.get(chave, {}).get("selection", {})
+
+
+def chaves_selecionadas(selecao, reserva=None):
+    """
+    Chaves dos pontos selecionados, lidas do customdata que cada gráfico carrega
+    (coleta_id, categoria ou coordenadas). Sem customdata, usa o campo `reserva`
+    do ponto (label da pizza, x da barra), se houver.
+    """
+    chaves = []
+    for ponto in selecao.get("points", []):
+        customdata = ponto.get("customdata")
+        if customdata is not None:
+            chaves.append(tuple(customdata) if len(customdata) > 1 else customdata[0])
+        elif reserva and ponto.get(reserva) is not None:
+            chaves.append(ponto[reserva])
+    return chaves
+
+
+def mascara_chaves(df, colunas, chaves):
+    """Máscara das linhas cujo valor (ou tupla de valores) em `colunas` está entre as `chaves`"""
+    if len(colunas) == 1:
+        return df[colunas[0]].isin(chaves).to_numpy()
+    return pd.MultiIndex.from_frame(df[colunas]).isin(chaves)
+
+
+def filtrar(df, local_selecionado, ph_selecionado, data_inicio, data_fim, estado_sessao, indice_mapa=None):
+    """
+    Aplica os filtros da sidebar e, por cima deles, as seleções feitas nos gráficos
+    (guardadas em `estado_sessao` pelas chaves pizza, barra, dispersao e mapa).
+
+    Cada gráfico leva no customdata a chave do que desenha (categoria, coleta_id ou
+    célula da grade do mapa), então um clique vira um teste de pertinência, sem refazer
+    contagens ou agrupamentos nem depender da posição do ponto no gráfico.
+    `indice_mapa` é o mapa.IndiceEspacial de df (criado aqui se faltar e houver seleção no mapa).
+    """
+    tempos = {}
+    inicio = time.perf_counter()
+
+    # 1. Filtros da Sidebar (Base)
+    mascara_base = mascara_sidebar(df, local_selecionado, ph_selecionado, data_inicio, data_fim)
+    tempos['sidebar'] = time.perf_counter() - inicio
+
+    # 2. Filtros interativos (Cross-filtering)
+    etapa = time.perf_counter()
+    mascara = mascara_base.copy()
+    filtros_ativos = []
+    cat_ph = cat_local = None
+    selecao_linhas = False
+
+    # --- Filtro vindo do Gráfico de Pizza (pH) ---
+    chaves = chaves_selecionadas(_selecao(estado_sessao, "pizza"), reserva="label")
+    if chaves:
+        cat_ph = chaves[0]
+        mascara &= mascara_chaves(df, ['carac_ph'], [cat_ph])
+        filtros_ativos.append(f"pH: {cat_ph}")
+
+    # --- Filtro vindo do Gráfico de Barras (Local) ---
+    chaves = chaves_selecionadas(_selecao(estado_sessao, "barra"), reserva="x")
+    if chaves:
+        cat_local = chaves[0]
+        mascara &= mascara_chaves(df, ['local_categoria'], [cat_local])
+        filtros_ativos.append(f"Local: {cat_local}")
+
+    # --- Filtro vindo da Dispersão (Pontos específicos) ---
+    # O gráfico pode mostrar só uma amostra dos pontos: caixa/laço são reaplicados sobre todas as
+    # linhas filtradas até aqui; cliques avulsos voltam às coletas pelo coleta_id do customdata
+    sel_disp = _selecao(estado_sessao, "dispersao")
+    if sel_disp and (sel_disp.get("box") or sel_disp.get("lasso") or sel_disp.get("points")):
+        posicoes = np.flatnonzero(mascara)
+        if sel_disp.get("box") or sel_disp.get("lasso"):
+            x = df['temp_ar_c'].to_numpy(dtype=np.float64, na_value=np.nan)[posicoes]
+            y = df['umidade_ar_perc'].to_numpy(dtype=np.float64, na_value=np.nan)[posicoes]
+            dentro = pontos_na_regiao(x, y, sel_disp)
+        else:
+            dentro = mascara_chaves(df.iloc[posicoes], ['coleta_id'], chaves_selecionadas(sel_disp))
+        mascara = np.zeros_like(mascara)
+        mascara[posicoes[dentro]] = True
+        filtros_ativos.append("Seleção na Dispersão")
+        selecao_linhas = True
+
+    # --- Filtro vindo do Mapa ---
+    # Cada marcador agrupa as coletas de uma célula da grade; o customdata traz (nível, célula)
+    chaves = chaves_selecionadas(_selecao(estado_sessao, "mapa"))
+    if chaves:
+        if indice_mapa is None:
+            indice_mapa = IndiceEspacial(df)
+        na_celula = np.zeros_like(mascara)
+        na_celula[indice_mapa.posicoes_das_celulas(chaves)] = True
+        mascara &= na_celula
+        filtros_ativos.append("Seleção no Mapa")
+        selecao_linhas = True
+    tempos['cruzados'] = time.perf_counter() - etapa
+
+    tempos['total'] = time.perf_counter() - inicio
+    return ResultadoFiltro(mascara_base, mascara, filtros_ativos, tempos, cat_ph, cat_local, selecao_linhas)
@@ -0,0 +1,308 @@
+"""
+Preparação dos dados e construção das figuras do dashboard
+Mantém o tamanho do que vai para o navegador limitado, independente do número de coletas
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from instrumentacao import medir
+
+# Acima disso a dispersão mostra uma amostra estratificada por carac_ph (desenhada em WebGL)
+LIMITE_PONTOS_DISPERSAO = 5000
+# Faixas do histograma de turbidez e máximo de outliers desenhados em cada caixa do boxplot
+FAIXAS_TURBIDEZ = 15
+LIMITE_OUTLIERS = 200
+CORES_TEMPERATURA = {'Água': '#3498db', 'Ar': '#e74c3c'}
+# Cache de figuras prontas: limite de memória (estimada pelos arrays das figuras) e de número de figuras
+LIMITE_CACHE_FIGURAS_BYTES = 64 * 1024 * 1024
+MAX_FIGURAS_CACHE = 256
+
+
+class CacheFiguras:
+    """
+    LRU de figuras já montadas, compartilhado entre as sessões. Cada figura é indexada
+    por (nome do gráfico, chave), e a chave deve identificar tudo de que a figura depende:
+    no dashboard, a versão dos dados e a assinatura das linhas filtradas.
+    """
+
+    def __init__(self, limite_bytes=LIMITE_CACHE_FIGURAS_BYTES, max_itens=MAX_FIGURAS_CACHE):
+        self.limite_bytes = limite_bytes
+        self.max_itens = max_itens
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # (nome, chave) -> (valor, bytes)
+        self._total_bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'removidas': 0}
+
+    @classmethod
+    def _tamanho(cls, valor):
+        # Funções que devolvem (figura, extra) guardam a tupla; o tamanho é o da figura
+        figura = valor[0] if isinstance(valor, tuple) else valor
+        if figura is None:
+            return 0
+        # Estimativa pelos dados já guardados na figura, sem serializá-la (o Streamlit
+        # serializa de novo no envio); _data e _layout são lidos sem a cópia de to_plotly_json
+        return cls._estimar_bytes(figura._data) + cls._estimar_bytes(figura._layout)
+
+    @classmethod
+    def _estimar_bytes(cls, valor):
+        """Bytes aproximados de um valor de figura: arrays pelo buffer, texto pelo comprimento"""
+        if isinstance(valor, np.ndarray):
+            if valor.dtype == object:
+                return sum(len(str(item)) for item in valor.ravel())
+            return valor.nbytes
+        if isinstance(valor, str):
+            return len(valor)
+        if isinstance(valor, dict):
+            return sum(len(chave) + cls._estimar_bytes(item) for chave, item in valor.items())
+        if isinstance(valor, (list, tuple)):
+            return sum(cls._estimar_bytes(item) for item in valor)
+        return 8
+
+    def obter(self, nome, chave, construir):
+        """Figura guardada para (nome, chave) ou, se não houver, o resultado de construir()"""
+        with self._lock:
+            item = self._itens.get((nome, chave))
+            if item is not None:
+                self._itens.move_to_end((nome, chave))
+                self._stats['hits'] += 1
+                return item[0]
+            self._stats['misses'] += 1
+
+        with medir(f"grafico.{nome}.construcao"):
+            valor = construir()
+        tamanho = self._tamanho(valor)
+        if tamanho > self.limite_bytes:
+            return valor
+
+        with self._lock:
+            anterior = self._itens.pop((nome, chave), None)
+            if anterior is not None:
+                self._total_bytes -= anterior[1]
+            self._itens[(nome, chave)] = (valor, tamanho)
+            self._total_bytes += tamanho
+            while self._total_bytes > self.limite_bytes or len(self._itens) > self.max_itens:
+                _, (_, removido) = self._itens.popitem(last=False)
+                self._total_bytes -= removido
+                self._stats['removidas'] += 1
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._total_bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['figuras'] = len(self._itens)
+            stats['bytes'] = self._total_bytes
+        stats['limite_bytes'] = self.limite_bytes
+        return stats
+
+
+_cache_figuras = CacheFiguras()
+
+
+def figura_em_cache(nome, chave, construir):
+    """Figura `nome` do cache do processo para `chave`, construída só quando falta"""
+    return _cache_figuras.obter(nome, chave, construir)
+
+
+def estatisticas_figuras():
+    return _cache_figuras.estatisticas()
+
+
+def amostrar_estratificado(df, coluna, limite, semente=0):
+    """
+    Até `limite` linhas de df, sorteadas dentro de cada valor de `coluna` na proporção
+    do seu tamanho (toda classe presente mantém ao menos um ponto). A semente fixa faz
+    o mesmo frame gerar sempre a mesma amostra, para o gráfico não "pular" entre reruns.
+    """
+    if len(df) <= limite:
+        return df
+
+    rng = np.random.default_rng(semente)
+    codigos, _ = df[coluna].factorize(use_na_sentinel=False)
+    contagens = np.bincount(codigos)
+    cotas = np.maximum(1, np.floor(limite * contagens / len(df)).astype(int))
+
+    escolhidas = []
+    for codigo, cota in enumerate(cotas):
+        posicoes = np.flatnonzero(codigos == codigo)
+        escolhidas.append(rng.choice(posicoes, size=min(cota, len(posicoes)), replace=False))
+    return df.iloc[np.sort(np.concatenate(escolhidas))]
+
+
+def figura_pizza(contagem_ph):
+    """Pizza das características do pH; None sem dados"""
+    if contagem_ph.empty:
+        return None
+    fig = px.pie(
+        values=contagem_ph.values,
+        names=contagem_ph.index,
+        color_discrete_sequence=px.colors.sequential.RdBu,
+        hole=0.4
+    )
+    # A categoria vai no customdata: o clique é resolvido pela chave, não pela posição da fatia
+    fig.update_traces(
+        customdata=contagem_ph.index.astype(str), textposition='inside', textinfo='percent+label', textfont_size=9
+    )
+    fig.update_layout(
+        showlegend=True, height=220, margin=dict(t=5, b=5, l=5, r=5),
+        legend=dict(font=dict(size=8))
+    )
+    return fig
+
+
+def figura_barra(contagem_local):
+    """Barras com a quantidade de coletas por local; None sem dados"""
+    if contagem_local.empty:
+        return None
+    local_counts = contagem_local.reset_index()
+    local_counts.columns = ['Local', 'Quantidade']
+    fig = px.bar(
+        local_counts,
+        x='Local', y='Quantidade',
+        color='Quantidade', color_continuous_scale='Blues',
+        text='Quantidade', custom_data=['Local']
+    )
+    fig.update_traces(textposition='outside', textfont_size=9)
+    fig.update_layout(
+        height=220, showlegend=False, xaxis_title="", yaxis_title="Qtd",
+        margin=dict(t=5, b=5, l=5, r=5), font=dict(size=9), xaxis=dict(tickangle=-45)
+    )
+    return fig
+
+
+def figura_dispersao(df_filtrado):
+    """Temp x Umidade em WebGL, com coleta_id em customdata para a seleção voltar às coletas"""
+    dados = amostrar_estratificado(df_filtrado, 'carac_ph', LIMITE_PONTOS_DISPERSAO)
+    fig = px.scatter(
+        dados,
+        x='temp_ar_c', y='umidade_ar_perc',
+        color='carac_ph', size='ph',
+        hover_data=['descricao_local'],
+        custom_data=['coleta_id'],
+        render_mode='webgl',
+        color_discrete_sequence=px.colors.qualitative.Set2,
+        labels={'temp_ar_c': 'Temp (°C)', 'umidade_ar_perc': 'Umidade (%)', 'carac_ph': 'pH'}
+    )
+    fig.update_layout(
+        height=220, margin=dict(t=5, b=5, l=5, r=5),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.6, font=dict(size=8)),
+        font=dict(size=9)
+    )
+    return fig, len(dados)
+
+
+def figura_mapa(celulas, zoom):
+    """
+    Um marcador por célula da grade (mapa.IndiceEspacial.agregar), no centroide das coletas
+    dela e do tamanho da quantidade; a célula vai no customdata. None sem dados
+    """
+    if celulas is None or celulas.empty:
+        return None
+    fig = px.scatter_mapbox(
+        celulas,
+        lat='latitude', lon='longitude', size='quantidade',
+        color='local_categoria', hover_name='descricao_local',
+        hover_data={'quantidade': True, 'locais': True, 'latitude': ':.5f', 'longitude': ':.5f'},
+        custom_data=['nivel', 'celula'],
+        color_discrete_sequence=px.colors.qualitative.Set3,
+        size_max=25, zoom=zoom, height=220,
+        center={'lat': (celulas['latitude'].min() + celulas['latitude'].max()) / 2,
+                'lon': (celulas['longitude'].min() + celulas['longitude'].max()) / 2},
+    )
+    fig.update_layout(
+        mapbox_style="open-street-map",
+        margin=dict(t=0, b=0, l=0, r=0),
+        legend=dict(font=dict(size=7))
+    )
+    return fig
+
+
+def _valores(serie):
+    valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    return valores[~np.isnan(valores)]
+
+
+def histograma(serie, nbins=FAIXAS_TURBIDEZ):
+    """
+    Faixas de mesma largura entre o mínimo e o máximo da série (nulos ignorados), no mesmo
+    formato de database.consultar_resumo: colunas inicio, fim e quantidade
+    """
+    valores = _valores(serie)
+    if not len(valores):
+        return pd.DataFrame({'inicio': [], 'fim': [], 'quantidade': []})
+    quantidade, bordas = np.histogram(valores, bins=nbins)
+    return pd.DataFrame({'inicio': bordas[:-1], 'fim': bordas[1:], 'quantidade': quantidade})
+
+
+def estatisticas_caixa(serie, limite_outliers=LIMITE_OUTLIERS):
+    """
+    Quartis, bigodes (último valor dentro de 1,5 x IQR, como no plotly) e outliers da série.
+    Com mais de `limite_outliers` outliers, fica um subconjunto espaçado por igual na ordem
+    dos valores, sempre com os extremos. Devolve None para série sem valores.
+    """
+    valores = _valores(serie)
+    if not len(valores):
+        return None
+    q1, mediana, q3 = np.percentile(valores, [25, 50, 75])
+    iqr = q3 - q1
+    dentro = valores[(valores >= q1 - 1.5 * iqr) & (valores <= q3 + 1.5 * iqr)]
+    outliers = np.sort(valores[(valores < q1 - 1.5 * iqr) | (valores > q3 + 1.5 * iqr)])
+    if len(outliers) > limite_outliers:
+        outliers = outliers[np.unique(np.linspace(0, len(outliers) - 1, limite_outliers).round().astype(int))]
+    return {
+        'q1': q1, 'mediana': mediana, 'q3': q3,
+        'bigode_inferior': dentro.min(), 'bigode_superior': dentro.max(),
+        'media': valores.mean(), 'outliers': outliers, 'n': len(valores),
+    }
+
+
+def figura_histograma(df_filtrado, faixas=None):
+    """Histograma de turbidez, uma barra por faixa; sem `faixas` (já contadas no banco), conta sobre df_filtrado"""
+    if faixas is None:
+        faixas = histograma(df_filtrado['turbidez_ntu'])
+    fig = go.Figure(go.Bar(
+        x=(faixas['inicio'] + faixas['fim']) / 2, y=faixas['quantidade'],
+        width=faixas['fim'] - faixas['inicio'],
+        customdata=faixas[['inicio', 'fim']],
+        hovertemplate='%{customdata[0]:.1f} - %{customdata[1]:.1f} NTU<br>Freq: %{y}<extra></extra>',
+        marker_color='#636EFA'
+    ))
+    fig.update_layout(
+        height=220, showlegend=False, xaxis_title="Turbidez (NTU)", yaxis_title="Freq",
+        margin=dict(t=5, b=5, l=5, r=5), font=dict(size=9), bargap=0
+    )
+    return fig
+
+
+def figura_boxplot(df_filtrado):
+    """Boxplot das temperaturas da água e do ar a partir das estatísticas já calculadas"""
+    fig = go.Figure()
+    for tipo, coluna in [('Água', 'temp_agua_c'), ('Ar', 'temp_ar_c')]:
+        estat = estatisticas_caixa(df_filtrado[coluna])
+        if estat is None:
+            continue
+        fig.add_trace(go.Box(
+            x=[tipo], name=tipo, marker_color=CORES_TEMPERATURA[tipo],
+            q1=[estat['q1']], median=[estat['mediana']], q3=[estat['q3']],
+            lowerfence=[estat['bigode_inferior']], upperfence=[estat['bigode_superior']],
+            mean=[estat['media']]
+        ))
+        if len(estat['outliers']):
+            fig.add_trace(go.Scatter(
+                x=[tipo] * len(estat['outliers']), y=estat['outliers'], mode='markers',
+                marker=dict(color=CORES_TEMPERATURA[tipo], size=4), name=tipo, hoverinfo='y'
+            ))
+    fig.update_layout(
+        height=220, showlegend=False, xaxis_title="", yaxis_title="Temp (°C)",
+        margin=dict(t=5, b=5, l=5, r=5), font=dict(size=9)
+    )
+    return fig
@@ -0,0 +1,201 @@
+"""
+Instrumentação de desempenho
+Mede o tempo de cada etapa (banco, conversões, filtragem, gráficos), acumula estatísticas
+do processo, grava um registro por rerun em JSON Lines e monta o painel de depuração da sidebar
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+try:
+    from config import INSTRUMENTACAO_CONFIG
+except ImportError:
+    INSTRUMENTACAO_CONFIG = {}
+
+# Arquivo JSON Lines com uma linha por rerun (None desativa) e durações guardadas por etapa
+ARQUIVO_LOG = INSTRUMENTACAO_CONFIG.get('arquivo_log')
+AMOSTRAS_POR_ETAPA = INSTRUMENTACAO_CONFIG.get('amostras_por_etapa', 1000)
+
+_local = threading.local()
+_lock = threading.Lock()
+_duracoes = defaultdict(lambda: deque(maxlen=AMOSTRAS_POR_ETAPA))  # etapa -> últimas durações (s)
+_log_lock = threading.Lock()
+
+
+class Rerun:
+    """Tempos e contadores de uma execução de página"""
+
+    def __init__(self, pagina):
+        self.pagina = pagina
+        self.inicio = time.time()
+        self._inicio_perf = time.perf_counter()
+        self.tempos = {}      # etapa -> segundos (somados quando a etapa se repete)
+        self.chamadas = {}    # etapa -> vezes
+        self.valores = {}     # linhas, memória, hits... anotados pela página
+        self.total_s = None
+
+    def registrar(self, etapa, segundos):
+        self.tempos[etapa] = self.tempos.get(etapa, 0.0) + segundos
+        self.chamadas[etapa] = self.chamadas.get(etapa, 0) + 1
+
+    def como_dict(self):
+        return {
+            'pagina': self.pagina,
+            'inicio': self.inicio,
+            'total_s': self.total_s if self.total_s is not None else time.perf_counter() - self._inicio_perf,
+            'tempos_s': self.tempos,
+            'chamadas': self.chamadas,
+            'valores': self.valores,
+        }
+
+
+def iniciar_rerun(pagina):
+    """Começa o registro do rerun da thread atual (cada sessão do Streamlit roda na sua)"""
+    _local.rerun = Rerun(pagina)
+    return _local.rerun
+
+
+def rerun_atual():
+    return getattr(_local, 'rerun', None)
+
+
+def registrar(etapa, segundos):
+    """Soma `segundos` à etapa no rerun atual (se houver) e nas estatísticas do processo"""
+    with _lock:
+        _duracoes[etapa].append(segundos)
+    rerun = rerun_atual()
+    if rerun is not None:
+        rerun.registrar(etapa, segundos)
+
+
+@contextmanager
+def medir(etapa):
+    """`with medir('filtros'): ...` registra o tempo do bloco"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(etapa, time.perf_counter() - inicio)
+
+
+def cronometrado(etapa):
+    """Decorador: registra o tempo de cada chamada da função"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def medida(*args, **kwargs):
+            with medir(etapa):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
+
+
+def anotar(**valores):
+    """Guarda valores do rerun atual (linhas processadas, memória, hits de cache...)"""
+    rerun = rerun_atual()
+    if rerun is not None:
+        rerun.valores.update(valores)
+
+
+def finalizar_rerun():
+    """Fecha o rerun atual e, se ARQUIVO_LOG estiver configurado, grava-o como uma linha JSON"""
+    rerun = rerun_atual()
+    if rerun is None:
+        return None
+    rerun.total_s = time.perf_counter() - rerun._inicio_perf
+    registrar(f"{rerun.pagina}.total", rerun.total_s)
+    _local.rerun = None
+    if ARQUIVO_LOG:
+        linha = json.dumps(rerun.como_dict(), default=_json_padrao, ensure_ascii=False)
+        with _log_lock, open(ARQUIVO_LOG, 'a', encoding='utf-8') as f:
+            f.write(linha + "\n")
+    return rerun
+
+
+def estatisticas():
+    """Por etapa: número de medições, média, p50, p95 e máximo (ms) das últimas durações"""
+    with _lock:
+        copias = {etapa: np.array(valores) for etapa, valores in _duracoes.items() if valores}
+    return {
+        etapa: {
+            'n': len(valores),
+            'media_ms': float(valores.mean() * 1000),
+            'p50_ms': float(np.percentile(valores, 50) * 1000),
+            'p95_ms': float(np.percentile(valores, 95) * 1000),
+            'max_ms': float(valores.max() * 1000),
+        }
+        for etapa, valores in sorted(copias.items())
+    }
+
+
+def exportar(extras=None):
+    """Estatísticas do processo (mais `extras`, como os caches) num dict serializável em JSON"""
+    return {
+        'gerado_em': time.time(),
+        'pid': os.getpid(),
+        'etapas': estatisticas(),
+        **(extras or {}),
+    }
+
+
+def exportar_json(caminho, extras=None):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(exportar(extras), f, default=_json_padrao, ensure_ascii=False, indent=2)
+
+
+def limpar():
+    with _lock:
+        _duracoes.clear()
+
+
+def _json_padrao(valor):
+    # numpy/pandas escalares e datas
+    if hasattr(valor, 'item'):
+        return valor.item()
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+
+def painel_debug(rerun, extras=None):
+    """
+    Painel de desempenho na sidebar: tempos do rerun, estatísticas do processo, valores
+    anotados e caches (`extras`: nome -> dict), com botão para baixar tudo em JSON
+    """
+    import pandas as pd
+    import streamlit as st
+
+    with st.sidebar.expander("🛠️ Desempenho", expanded=True):
+        dados = rerun.como_dict()
+        st.caption(f"Rerun: {dados['total_s'] * 1000:.0f} ms")
+        if rerun.tempos:
+            tempos = pd.DataFrame({
+                'ms': [segundos * 1000 for segundos in rerun.tempos.values()],
+                'vezes': list(rerun.chamadas.values()),
+            }, index=list(rerun.tempos)).sort_values('ms', ascending=False)
+            st.dataframe(tempos.round(1), use_container_width=True)
+        if rerun.valores:
+            st.json(json.loads(json.dumps(rerun.valores, default=_json_padrao)), expanded=False)
+
+        for nome, valores in (extras or {}).items():
+            st.markdown(f"**{nome}**")
+            st.json(json.loads(json.dumps(valores, default=_json_padrao)), expanded=False)
+
+        processo = pd.DataFrame.from_dict(estatisticas(), orient='index')
+        if not processo.empty:
+            st.markdown("**Processo (últimas medições)**")
+            st.dataframe(processo.round(1), use_container_width=True)
+
+        exportado = exportar({'rerun': dados, **(extras or {})})
+        st.download_button(
+            "⬇️ Exportar JSON",
+            json.dumps(exportado, default=_json_padrao, ensure_ascii=False, indent=2),
+            file_name=f"desempenho_{rerun.pagina}_{int(rerun.inicio)}.json",
+            mime="application/json",
+            use_container_width=True,
+        )
@@ -0,0 +1,200 @@
+"""
+Agregação espacial do mapa
+Índice das coletas numa grade de células quadradas em vários níveis (estilo geohash: cada nível
+divide a célula do anterior em quatro), construído uma vez por versão dos dados. A cada rerun o
+mapa recebe um marcador por célula ocupada, no nível mais fino que caiba em LIMITE_MARCADORES
+"""
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import cronometrado
+
+# Nível n: células de 360 / 2^n graus de lado (nível 24 ~ 2 m, nível 16 ~ 600 m no equador)
+NIVEL_MAXIMO = 24
+# Máximo de marcadores enviados ao navegador, independente do número de coletas
+LIMITE_MARCADORES = 300
+# Níveis acima do zoom do mapa: no zoom z, células do nível z + 5 têm ~8 px (256 / 2^5)
+NIVEIS_ACIMA_DO_ZOOM = 5
+ZOOM_MAXIMO = 17
+# Largura aproximada do mapa (px), usada para enquadrar os pontos
+LARGURA_MAPA_PX = 300
+METROS_POR_GRAU = 111_320
+
+_indice_lock = threading.Lock()
+_indice = {
+    'versao': None,
+    'indice': None,
+}
+
+
+def _espalhar_bits(valores):
+    """Intercala zeros entre os bits (inteiros de até 32 bits -> posições pares de 64 bits)"""
+    x = valores.astype(np.uint64)
+    for deslocamento, mascara in [
+        (16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333), (1, 0x5555555555555555),
+    ]:
+        x = (x | (x << np.uint64(deslocamento))) & np.uint64(mascara)
+    return x
+
+
+def codigo_celula(latitude, longitude, nivel=NIVEL_MAXIMO):
+    """
+    Código Morton (bits de longitude e latitude intercalados) da célula de cada ponto no nível
+    pedido. O código de um nível é prefixo do código dos níveis mais finos: `codigo >> 2`
+    é a célula que contém a célula `codigo` no nível de cima.
+    """
+    lado = 360.0 / 2 ** nivel
+    ix = np.floor((np.asarray(longitude, dtype=np.float64) + 180.0) / lado).astype(np.int64)
+    iy = np.floor((np.asarray(latitude, dtype=np.float64) + 90.0) / lado).astype(np.int64)
+    ix = np.clip(ix, 0, 2 ** nivel - 1)
+    iy = np.clip(iy, 0, 2 ** (nivel - 1) - 1) if nivel else iy * 0
+    return (_espalhar_bits(ix) | (_espalhar_bits(iy) << np.uint64(1))).astype(np.int64)
+
+
+def lado_celula_m(nivel, latitude=0.0):
+    """Lado da célula do nível em metros (na direção leste-oeste, na latitude dada)"""
+    return 360.0 / 2 ** nivel * METROS_POR_GRAU * math.cos(math.radians(latitude))
+
+
+def zoom_para_extensao(lat_min, lat_max, lon_min, lon_max):
+    """Zoom do mapbox que enquadra o retângulo em ~LARGURA_MAPA_PX pixels"""
+    extensao = max(lon_max - lon_min, (lat_max - lat_min) / max(math.cos(math.radians((lat_min + lat_max) / 2)), 0.1))
+    if extensao <= 0:
+        return ZOOM_MAXIMO
+    zoom = math.log2(360.0 * LARGURA_MAPA_PX / (256.0 * extensao))
+    return int(min(max(math.floor(zoom), 1), ZOOM_MAXIMO))
+
+
+class IndiceEspacial:
+    """
+    Coletas com coordenadas ordenadas pelo código Morton do nível mais fino. Nessa ordem as
+    células de qualquer nível são trechos contíguos, então contagens, centroides e a busca
+    das coletas de uma célula são fatias e somas por trecho, sem groupby.
+    """
+
+    def __init__(self, df):
+        latitude = df['latitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+        longitude = df['longitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+        validas = np.flatnonzero(~np.isnan(latitude) & ~np.isnan(longitude))
+
+        codigos = codigo_celula(latitude[validas], longitude[validas])
+        ordem = np.argsort(codigos)
+        self.posicoes = validas[ordem]      # posição (iloc) no frame de cada linha do índice
+        self.codigos = codigos[ordem]
+        self.latitude = latitude[self.posicoes]
+        self.longitude = longitude[self.posicoes]
+        self.coleta_id = df['coleta_id'].to_numpy()[self.posicoes]
+
+        # Categoria e descrição do local como códigos, para achar a predominante de cada célula
+        self._rotulos = {}
+        for coluna in ['local_categoria', 'descricao_local']:
+            serie = df[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                codigos_coluna, valores = serie.cat.codes.to_numpy()[self.posicoes], serie.cat.categories
+            else:
+                codigos_coluna, valores = pd.factorize(serie.to_numpy()[self.posicoes])
+            self._rotulos[coluna] = (codigos_coluna, np.asarray(valores, dtype=object))
+
+        # Células ocupadas por nível, com todas as coletas (limite superior para qualquer filtro)
+        self.celulas_por_nivel = np.array([
+            self._contar_celulas(self.codigos, nivel) for nivel in range(NIVEL_MAXIMO + 1)
+        ])
+
+    @staticmethod
+    def _contar_celulas(codigos, nivel):
+        if not len(codigos):
+            return 0
+        celulas = codigos >> (2 * (NIVEL_MAXIMO - nivel))
+        return int(np.count_nonzero(celulas[1:] != celulas[:-1])) + 1
+
+    def escolher_nivel(self, codigos, nivel_maximo, limite=LIMITE_MARCADORES):
+        """Nível mais fino (até nivel_maximo) em que as linhas ocupam no máximo `limite` células"""
+        for nivel in range(nivel_maximo, -1, -1):
+            if self.celulas_por_nivel[nivel] <= limite or self._contar_celulas(codigos, nivel) <= limite:
+                return nivel
+        return 0
+
+    @cronometrado('mapa.agregacao')
+    def agregar(self, mascara, limite=LIMITE_MARCADORES):
+        """
+        Um registro por célula ocupada pelas linhas da máscara (sobre o frame inteiro): centroide,
+        quantidade, local predominante, nível e código da célula (a chave da seleção no mapa).
+        Retorna (células, zoom), ou (None, None) sem linhas com coordenadas.
+        """
+        selecionadas = np.asarray(mascara, dtype=bool)[self.posicoes]
+        if not selecionadas.any():
+            return None, None
+        codigos = self.codigos[selecionadas]
+        latitude = self.latitude[selecionadas]
+        longitude = self.longitude[selecionadas]
+
+        zoom = zoom_para_extensao(latitude.min(), latitude.max(), longitude.min(), longitude.max())
+        nivel = self.escolher_nivel(codigos, min(zoom + NIVEIS_ACIMA_DO_ZOOM, NIVEL_MAXIMO), limite)
+        celulas = codigos >> (2 * (NIVEL_MAXIMO - nivel))
+
+        # Trechos contíguos de mesma célula
+        inicios = np.flatnonzero(np.r_[True, celulas[1:] != celulas[:-1]])
+        quantidade = np.diff(np.r_[inicios, len(celulas)])
+        trecho = np.repeat(np.arange(len(inicios)), quantidade)
+
+        resultado = {
+            'latitude': np.add.reduceat(latitude, inicios) / quantidade,
+            'longitude': np.add.reduceat(longitude, inicios) / quantidade,
+            'quantidade': quantidade,
+        }
+        for coluna, (codigos_coluna, valores) in self._rotulos.items():
+            resultado[coluna] = self._predominante(trecho, codigos_coluna[selecionadas], valores, len(inicios))
+        codigos_descricao, descricoes = self._rotulos['descricao_local']
+        resultado['locais'] = self._distintos(trecho, codigos_descricao[selecionadas], descricoes, len(inicios))
+        resultado['nivel'] = np.full(len(inicios), nivel)
+        resultado['celula'] = celulas[inicios]
+        return pd.DataFrame(resultado), zoom
+
+    @staticmethod
+    def _tabela(trecho, codigos, valores, n_trechos):
+        # Contagem por (trecho, valor); o código -1 (nulo) vai para a última coluna
+        n_valores = len(valores) + 1
+        return np.bincount(
+            trecho * n_valores + np.where(codigos < 0, n_valores - 1, codigos), minlength=n_trechos * n_valores
+        ).reshape(n_trechos, n_valores)
+
+    @classmethod
+    def _predominante(cls, trecho, codigos, valores, n_trechos):
+        return np.append(valores, None)[cls._tabela(trecho, codigos, valores, n_trechos).argmax(axis=1)]
+
+    @classmethod
+    def _distintos(cls, trecho, codigos, valores, n_trechos):
+        return (cls._tabela(trecho, codigos, valores, n_trechos) > 0).sum(axis=1)
+
+    def _linhas_das_celulas(self, chaves):
+        # Cada célula é o trecho [celula << d, (celula + 1) << d) dos códigos ordenados
+        trechos = []
+        for nivel, celula in chaves:
+            if not 0 <= int(nivel) <= NIVEL_MAXIMO:  # chave de outro formato (figura antiga)
+                continue
+            deslocamento = 2 * (NIVEL_MAXIMO - int(nivel))
+            a, b = np.searchsorted(self.codigos, [int(celula) << deslocamento, (int(celula) + 1) << deslocamento])
+            trechos.append(np.arange(a, b))
+        return np.unique(np.concatenate(trechos)) if trechos else np.empty(0, dtype=np.int64)
+
+    def posicoes_das_celulas(self, chaves):
+        """Posições (iloc) no frame das coletas dentro das células (nivel, celula) selecionadas"""
+        return self.posicoes[self._linhas_das_celulas(chaves)]
+
+    def coletas_das_celulas(self, chaves):
+        """coleta_id das coletas dentro das células (nivel, celula) selecionadas no mapa"""
+        return self.coleta_id[self._linhas_das_celulas(chaves)]
+
+
+@cronometrado('mapa.indice')
+def obter_indice(df, versao):
+    """Índice espacial do frame atual, reconstruído só quando a versão dos dados muda"""
+    with _indice_lock:
+        if _indice['versao'] != versao or _indice['indice'] is None:
+            _indice['indice'] = IndiceEspacial(df)
+            _indice['versao'] = versao
+        return _indice['indice']
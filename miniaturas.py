@@ -0,0 +1,229 @@
+"""
+Serviço de miniaturas das fotos das coletas
+Cache em disco (LRU limitado por tamanho) de imagens redimensionadas, indexadas pelo id do
+arquivo no Google Drive, com pré-carregamento em segundo plano e backend de busca plugável
+"""
+import os
+import re
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+try:
+    from PIL import Image
+except ImportError:  # sem Pillow as imagens são guardadas como vieram
+    Image = None
+
+try:
+    from config import MINIATURAS_CONFIG
+except ImportError:
+    MINIATURAS_CONFIG = {}
+
+_ID_VALIDO = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def extrair_id_drive(url):
+    """Id do arquivo numa URL do Google Drive (formatos ?id=... e /d/.../), ou None"""
+    url = str(url)
+    if 'drive.google.com' not in url:
+        return None
+    if 'id=' in url:
+        return url.split('id=')[1].split('&')[0] or None
+    if '/d/' in url:
+        return url.split('/d/')[1].split('/')[0] or None
+    return None
+
+
+class BackendDrive:
+    """Busca a miniatura no endpoint de thumbnails do Google Drive"""
+
+    def __init__(self, largura=500, timeout=10):
+        self.largura = largura
+        self.timeout = timeout
+
+    def buscar(self, file_id):
+        url = f"https://drive.google.com/thumbnail?id={file_id}&sz=w{self.largura}"
+        with urllib.request.urlopen(url, timeout=self.timeout) as resposta:
+            return resposta.read()
+
+
+class BackendDiretorio:
+    """Lê as imagens de um diretório local (<file_id>.<extensão>), no lugar do Drive, para uso offline"""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+
+    def buscar(self, file_id):
+        for nome in os.listdir(self.diretorio):
+            if os.path.splitext(nome)[0] == file_id:
+                with open(os.path.join(self.diretorio, nome), 'rb') as f:
+                    return f.read()
+        raise FileNotFoundError(f"Imagem {file_id} não encontrada em {self.diretorio}")
+
+
+class ServicoMiniaturas:
+    """
+    Miniaturas redimensionadas para `largura` px, guardadas em `diretorio` como <file_id>.jpg.
+
+    O diretório funciona como LRU: cada acesso renova a data do arquivo e, quando o total
+    passa de `limite_bytes`, os menos usados são apagados. prefetch() aquece o cache em
+    segundo plano (por exemplo, com as fotos das amostras vizinhas).
+    """
+
+    def __init__(self, diretorio, backend, limite_bytes=200 * 1024 * 1024, largura=500, workers=2):
+        self.diretorio = diretorio
+        self.backend = backend
+        self.limite_bytes = limite_bytes
+        self.largura = largura
+        os.makedirs(diretorio, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._em_andamento = {}  # file_id -> Event de quem está buscando
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='miniaturas')
+        self._stats = {'hits': 0, 'misses': 0, 'erros': 0, 'prefetch': 0, 'removidas': 0}
+
+        # Reconstrói a ordem LRU a partir das datas dos arquivos já em disco
+        arquivos = []
+        for nome in os.listdir(diretorio):
+            if nome.endswith('.jpg'):
+                info = os.stat(os.path.join(diretorio, nome))
+                arquivos.append((info.st_mtime, nome[:-4], info.st_size))
+        self._lru = OrderedDict((file_id, tamanho) for _, file_id, tamanho in sorted(arquivos))
+        self._total_bytes = sum(self._lru.values())
+
+    def _caminho(self, file_id):
+        return os.path.join(self.diretorio, f"{file_id}.jpg")
+
+    def _redimensionar(self, dados):
+        if Image is None:
+            return dados
+        imagem = Image.open(BytesIO(dados))
+        if imagem.width > self.largura:
+            altura = max(1, round(imagem.height * self.largura / imagem.width))
+            imagem = imagem.resize((self.largura, altura))
+        saida = BytesIO()
+        imagem.convert('RGB').save(saida, format='JPEG', quality=85)
+        return saida.getvalue()
+
+    def _ler_cache(self, file_id):
+        with self._lock:
+            if file_id not in self._lru:
+                return None
+            self._lru.move_to_end(file_id)
+        try:
+            with open(self._caminho(file_id), 'rb') as f:
+                dados = f.read()
+            os.utime(self._caminho(file_id))
+            return dados
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._lru.pop(file_id, 0)
+            return None
+
+    def _gravar(self, file_id, dados):
+        caminho = self._caminho(file_id)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, 'wb') as f:
+            f.write(dados)
+        os.replace(temporario, caminho)
+
+        with self._lock:
+            self._total_bytes += len(dados) - self._lru.pop(file_id, 0)
+            self._lru[file_id] = len(dados)
+            removidas = []
+            while self._total_bytes > self.limite_bytes and len(self._lru) > 1:
+                antiga, tamanho = self._lru.popitem(last=False)
+                self._total_bytes -= tamanho
+                removidas.append(antiga)
+            self._stats['removidas'] += len(removidas)
+        for antiga in removidas:
+            try:
+                os.remove(self._caminho(antiga))
+            except FileNotFoundError:
+                pass
+
+    def obter(self, file_id):
+        """Bytes JPEG da miniatura (do cache ou buscados no backend), ou None se falhar"""
+        file_id = _ID_VALIDO.sub('', str(file_id))
+        if not file_id:
+            return None
+
+        while True:
+            dados = self._ler_cache(file_id)
+            if dados is not None:
+                with self._lock:
+                    self._stats['hits'] += 1
+                return dados
+
+            with self._lock:
+                evento = self._em_andamento.get(file_id)
+                if evento is None:
+                    evento = self._em_andamento[file_id] = threading.Event()
+                    dono = True
+                else:
+                    dono = False
+            if dono:
+                break
+            # Outra thread já está buscando esta imagem: espera e relê do cache
+            evento.wait()
+            with self._lock:
+                falhou = file_id not in self._lru
+            if falhou:
+                return None
+
+        try:
+            dados = self._redimensionar(self.backend.buscar(file_id))
+            self._gravar(file_id, dados)
+            with self._lock:
+                self._stats['misses'] += 1
+            return dados
+        except Exception:
+            with self._lock:
+                self._stats['erros'] += 1
+            return None
+        finally:
+            with self._lock:
+                self._em_andamento.pop(file_id).set()
+
+    def prefetch(self, file_ids):
+        """Agenda em segundo plano a busca das miniaturas que ainda não estão no cache"""
+        for file_id in file_ids:
+            file_id = _ID_VALIDO.sub('', str(file_id or ''))
+            with self._lock:
+                if not file_id or file_id in self._lru or file_id in self._em_andamento:
+                    continue
+                self._stats['prefetch'] += 1
+            self._executor.submit(self.obter, file_id)
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['arquivos'] = len(self._lru)
+            stats['bytes'] = self._total_bytes
+        stats['limite_bytes'] = self.limite_bytes
+        return stats
+
+
+_servico = None
+_servico_lock = threading.Lock()
+
+
+def obter_servico():
+    """Serviço de miniaturas do processo, configurado por MINIATURAS_CONFIG (config.py)"""
+    global _servico
+    with _servico_lock:
+        if _servico is None:
+            largura = MINIATURAS_CONFIG.get('largura', 500)
+            if MINIATURAS_CONFIG.get('backend') == 'diretorio':
+                backend = BackendDiretorio(MINIATURAS_CONFIG['diretorio_origem'])
+            else:
+                backend = BackendDrive(largura=largura)
+            _servico = ServicoMiniaturas(
+                MINIATURAS_CONFIG.get('diretorio', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_miniaturas')),
+                backend,
+                limite_bytes=MINIATURAS_CONFIG.get('limite_mb', 200) * 1024 * 1024,
+                largura=largura,
+            )
+        return _servico
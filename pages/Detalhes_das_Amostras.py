@@ -6,10 +6,16 @@ import streamlit as st
 import pandas as pd
 import sys
 sys.path.append('..')
-from database import get_all_data, extrair_local_categoria, converter_url_drive
+from database import carregar_dados, estatisticas_cache, fotos_da_coleta
+from amostras import ORDEM_LOCAIS, TAMANHO_PAGINA, obter_indice
+from miniaturas import extrair_id_drive, obter_servico
+from instrumentacao import INSTRUMENTACAO_CONFIG, anotar, finalizar_rerun, iniciar_rerun, medir, painel_debug
 
 st.set_page_config(page_title="Detalhes das Amostras", page_icon="📋", layout="wide")
 
+# Tempos de cada etapa deste rerun (painel de desempenho e log em JSON)
+rerun = iniciar_rerun('detalhes')
+
 st.markdown("""<style>
 /* Forçar altura 100vh e remover scroll */
 html, body, [data-testid="stAppViewContainer"], . main {
@@ -92,15 +98,9 @@ header[data-testid="stHeader"] {
 }
 </style>""", unsafe_allow_html=True)
 
-@st.cache_data(ttl=300)
-def load_data():
-    df = get_all_data()
-    df['local_categoria'] = df['descricao_local'].apply(extrair_local_categoria)
-    df['url_foto_view'] = df['url_foto'].apply(converter_url_drive)
-    return df
-
 try:
-    df = load_data()
+    with medir('detalhes.carregar_dados'):
+        df, versao = carregar_dados()
     if df.empty:
         st. error("⚠️ Nenhum dado encontrado!")
         st.stop()
@@ -108,40 +108,89 @@ except Exception as e:
     st. error(f"❌ Erro: {e}")
     st.stop()
 
+# Índice coleta_id -> linha e ordem de navegação, reconstruído só quando os dados mudam
+with medir('detalhes.indice'):
+    indice = obter_indice(df, versao)
+
+def encerrar_rerun():
+    """Painel de desempenho (se ligado) e registro do rerun; chamar antes de qualquer st.stop()"""
+    if mostrar_desempenho:
+        painel_debug(rerun, {'cache_dados': estatisticas_cache(), 'miniaturas': obter_servico().estatisticas()})
+    finalizar_rerun()
+
+def navegar(passo):
+    """Callback dos botões Anterior/Próxima: vai para a vizinha no mesmo local e abre a página dela"""
+    vizinha = indice.vizinha(st.session_state.get("coleta_id"), passo)
+    if vizinha is not None:
+        st.session_state["coleta_id"] = vizinha
+        st.session_state["busca_amostra"] = ""
+        local = indice.local_de(vizinha)
+        st.session_state["local_amostra"] = local or "Todos"
+        # Local fora da lista do seletor: a página é contada sobre todas as coletas
+        posicao = indice.posicao_no_local(vizinha)[0] if local else indice.posicao_na_ordem(vizinha)
+        st.session_state["pagina_amostras"] = posicao // TAMANHO_PAGINA + 1
+
+def selecionar():
+    """Callback do seletor: guarda a amostra escolhida na página atual"""
+    st.session_state["coleta_id"] = st.session_state.get("amostra")
+
 # ==================== SIDEBAR ====================
 with st.sidebar:
-    ordem_locais = ['Prédio 1', 'Prédio 2', 'Anexo I', 'Anexo III', 'Anexo IV', 'Outros']
-    df['local_categoria_ordered'] = pd.Categorical(df['local_categoria'], categories=ordem_locais, ordered=True)
-    df_ordenado = df.sort_values(['local_categoria_ordered', 'coleta_id'])
+    st.header("🔍 Selecione uma amostra:")
     
-    opcoes_amostras = []
-    for local in ordem_locais:
-        amostras_local = df_ordenado[df_ordenado['local_categoria'] == local]
-        if not amostras_local.empty:
-            opcoes_amostras. append(f"━━━━━━ {local} ━━━━━━")
-            for _, row in amostras_local.iterrows():
-                opcao = f"  #{row['coleta_id']:02d} | {row['data_hora'].strftime('%d/%m/%Y %H:%M')} | {row['descricao_local'][:40]}"
-                opcoes_amostras.append(opcao)
+    # Busca e paginação rodam sobre o índice em memória; só a página atual vai para o navegador
+    busca = st.text_input("Buscar", key="busca_amostra", placeholder="ID, data ou local", label_visibility="collapsed")
+    local_filtro = st.selectbox("📍 Local:", ["Todos"] + ORDEM_LOCAIS, key="local_amostra")
     
-    st.header("🔍 Selecione uma amostra:")
-
-    if opcoes_amostras:
-        amostra_selecionada = st.selectbox(
-            "Amostra",
-            opcoes_amostras,
-            label_visibility="collapsed"
-        )
+    with medir('detalhes.busca'):
+        resultado = indice.buscar(busca, None if local_filtro == "Todos" else local_filtro)
+    total_paginas = max(1, -(-len(resultado) // TAMANHO_PAGINA))
+    if st.session_state.get("pagina_amostras", 1) > total_paginas:
+        st.session_state["pagina_amostras"] = 1
+    pagina = st.number_input(
+        f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas, step=1, key="pagina_amostras"
+    )
+    st.caption(f"{len(resultado)} amostra(s) encontrada(s)")
+    
+    opcoes_amostras = indice.pagina(resultado, int(pagina))
+    coleta_id = st.session_state.get("coleta_id")
+    if coleta_id is not None and indice.linha(coleta_id) is None:
+        # A amostra escolhida deixou de existir numa atualização dos dados
+        coleta_id = st.session_state["coleta_id"] = None
+    
+    st.selectbox(
+        "Amostra",
+        opcoes_amostras,
+        index=opcoes_amostras.index(coleta_id) if coleta_id in opcoes_amostras else None,
+        format_func=indice.rotulo,
+        placeholder="Escolha uma amostra",
+        label_visibility="collapsed",
+        key="amostra",
+        on_change=selecionar
+    )
+    
+    if coleta_id is not None:
+        posicao, total_local = indice.posicao_no_local(coleta_id)
+        col_ant, col_prox = st.columns(2)
+        col_ant.button("⬅️ Anterior", on_click=navegar, args=(-1,), disabled=posicao == 0, use_container_width=True)
+        col_prox.button("Próxima ➡️", on_click=navegar, args=(1,), disabled=posicao == total_local - 1, use_container_width=True)
+        st.caption(f"#{coleta_id}: amostra {posicao + 1} de {total_local} em {indice.local_de(coleta_id) or 'Outros'}")
 
     st.markdown("---")
 
-    if amostra_selecionada. startswith('━'):
+    if coleta_id is None:
         st.info("👆 Selecione uma amostra específica acima")    
 
+mostrar_desempenho = INSTRUMENTACAO_CONFIG.get('painel', True) and st.sidebar.checkbox(
+    "🛠️ Painel de desempenho", key="painel_desempenho"
+)
+anotar(linhas=len(df), resultados_busca=len(resultado), coleta_id=coleta_id)
+
 # ==================== CONTEÚDO PRINCIPAL ====================
 
 st.title("📋 Detalhes das Amostras")
 
-if amostra_selecionada. startswith('━'):
+if coleta_id is None:
     st.markdown("""
     <div style='display: flex; flex-direction: column; align-items: center; justify-content: center; height: 70vh; text-align: center;'>
         <div style='font-size: 5rem; margin-bottom: 1rem;'>🔍</div>
@@ -149,11 +198,12 @@ if amostra_selecionada. startswith('━'):
         <div style='font-size: 1rem; color: #999;'>Selecione uma amostra específica na barra lateral</div>
     </div>
     """, unsafe_allow_html=True)
+    encerrar_rerun()
     st.stop()
 
-if not amostra_selecionada.startswith('━'):
-    coleta_id = int(amostra_selecionada.split('#')[1]. split(' ')[0])
-    amostra = df[df['coleta_id'] == coleta_id]. iloc[0]
+if coleta_id is not None:
+    # Acesso direto pela posição, sem varrer o frame
+    amostra = df.iloc[indice.linha(coleta_id)]
     
     # ========== LAYOUT: DADOS | FOTO ==========
     col_dados, col_foto = st. columns([2.5, 1])
@@ -236,8 +286,8 @@ if not amostra_selecionada.startswith('━'):
             st.metric("Umidade Ar", f"{umidade_val:.1f} %")
         
         with col_d:
-            classificacao = "Alta" if turbidez_val > 100 else "Baixa"
-            st.metric("Classe Turbidez", classificacao)
+            # Classificações calculadas uma vez por carga (database.derivar_colunas)
+            st.metric("Classe Turbidez", amostra['classe_turbidez'])
         
         st.markdown("")
         
@@ -276,21 +326,21 @@ if not amostra_selecionada.startswith('━'):
         col_c1, col_c2, col_c3 = st. columns(3)
         
         with col_c1:
-            if amostra['carac_ph'] == 'Neutro':
+            if amostra['classe_ph'] == 'Neutro':
                 st.success("✅ pH Neutro")
-            elif amostra['carac_ph'] == 'Ácido':
+            elif amostra['classe_ph'] == 'Ácido':
                 st.error("🔴 pH Ácido")
             else:
                 st.info("🔵 pH Básico")
         
         with col_c2:
-            if turbidez_val > 100:
+            if amostra['classe_turbidez'] == 'Alta':
                 st.warning("⚠️ Turbidez Alta")
             else:
                 st.success("✅ Turbidez Normal")
         
         with col_c3:
-            if temp_agua_val > 25:
+            if amostra['classe_temp_agua'] == 'Aquecida':
                 st.warning("🌡️ Água Aquecida")
             else:
                 st.success("❄️ Temperatura Normal")
@@ -298,29 +348,47 @@ if not amostra_selecionada.startswith('━'):
     with col_foto:
         st. markdown("### 📸 Registro Fotográfico")
         
-        if pd.notna(amostra['url_foto']):
-            url_foto = str(amostra['url_foto'])
-            
+        # Fotos ficam numa tabela própria (uma coleta pode ter várias), buscada só aqui
+        try:
+            with medir('detalhes.fotos'):
+                fotos = fotos_da_coleta(amostra['coleta_id'])['url_foto'].dropna()
+            fotos_disponiveis = True
+        except Exception:
+            # Banco fora do ar e sem snapshot das fotos: o resto da página continua
+            fotos, fotos_disponiveis = pd.Series(dtype=object), False
+        
+        servico = obter_servico()
+        for url_foto in fotos.astype(str):
             # Extrair ID do Google Drive
-            file_id = None
-            if 'drive.google.com' in url_foto:
-                if 'id=' in url_foto:
-                    file_id = url_foto.split('id=')[1]. split('&')[0]
-                elif '/d/' in url_foto:
-                    file_id = url_foto.split('/d/')[1]. split('/')[0]
+            file_id = extrair_id_drive(url_foto)
             
             if file_id:
-                # Usar thumbnail do Google Drive
-                url_thumbnail = f"https://drive.google.com/thumbnail?id={file_id}&sz=w500"
+                # Miniatura redimensionada servida do cache local (buscada no Drive só na primeira vez)
+                with medir('detalhes.miniatura'):
+                    imagem = servico.obter(file_id)
                 
-                try:
-                    st.image(url_thumbnail, use_container_width=True, caption=f"Amostra #{amostra['coleta_id']}")
-                except:
+                if imagem is not None:
+                    st.image(imagem, use_container_width=True, caption=f"Amostra #{amostra['coleta_id']}")
+                else:
                     st.warning("⚠️ Não foi possível carregar a imagem.")
                 
                 st.markdown(f"[🔗 Abrir foto no Google Drive](https://drive.google.com/file/d/{file_id}/view)")
             else:
                 st.error("❌ URL da foto inválida")
                 st.markdown(f"[🔗 Ver link]({url_foto})")
-        else:
-            st.info("📷 Sem foto disponível para esta amostra")
\ No newline at end of file
+        
+        # Aquece o cache com as fotos das amostras vizinhas (Anterior/Próxima)
+        if fotos_disponiveis:
+            vizinhas = [indice.vizinha(coleta_id, passo) for passo in (1, -1, 2, -2)]
+            servico.prefetch(
+                extrair_id_drive(url)
+                for vizinha in vizinhas if vizinha is not None
+                for url in fotos_da_coleta(vizinha)['url_foto'].dropna()
+            )
+        
+        if not fotos_disponiveis:
+            st.info("📷 Fotos indisponíveis no momento (sem conexão com o banco de dados)")
+        elif fotos.empty:
+            st.info("📷 Sem foto disponível para esta amostra")
+
+encerrar_rerun()
\ No newline at end of file
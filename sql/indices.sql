@@ -0,0 +1,11 @@
+-- Índices sugeridos para o modo servidor (database.consultar_resumo)
+-- e para a sincronização incremental (database.sincronizar_dados)
+
+-- Filtro por período e MAX(data_hora) da assinatura
+CREATE INDEX idx_coletas_data_hora ON COLETAS (data_hora);
+
+-- Filtro por local e junção com LOCAIS
+CREATE INDEX idx_coletas_local_id ON COLETAS (local_id);
+
+-- Busca das fotos de uma coleta (database.fotos_da_coleta / get_fotos)
+CREATE INDEX idx_fotos_coleta_id ON FOTOS (coleta_id);